@@ -50,7 +50,7 @@ class PDFOrder():
     WIDTH, HEIGHT = A4
 
 
-    def __init__(self, pdf_file, request, record, db, conf):
+    def __init__(self, pdf_file, request, record, db, conf, press_config=None):
 
         self.IM_PATH = join(request.env.web2py_path, PDFOrder.IMG_PATH)
         self.record = record.as_dict()
@@ -60,7 +60,7 @@ class PDFOrder():
 
         self.db = db
 
-        self.ompdal = OMPDAL(db, conf)
+        self.ompdal = OMPDAL(db, conf, press_config=press_config)
 
         self.press_id = self.ompdal.getSubmission(self.submission_id)['context_id']
 
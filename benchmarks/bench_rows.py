@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark OMPDAL getters returning pydal Rows against the raw row mode.
+
+Run from the repository root (requires web2py on the Python path):
+
+    python benchmarks/bench_rows.py [number of submissions] [chapters per submission]
+"""
+import sys
+import timeit
+
+from fixtures import CONF, create_db, populate_press
+
+from ompdal import OMPDAL
+
+
+def main(submissions=20, chapters=40):
+    db = populate_press(create_db(), submissions=submissions, chapters=chapters)
+    ids = list(range(1, submissions + 1))
+
+    def workload(ompdal):
+        def run():
+            for submission_id in ids:
+                ompdal.getSubmissionSettings(submission_id)
+                ompdal.getPublicationFormatsBySubmission(submission_id)
+                ompdal.getSubmissionFileBySubmission(submission_id)
+                for chapter in ompdal.getChaptersBySubmission(submission_id):
+                    ompdal.getChapterSettings(chapter.chapter_id)
+        return run
+
+    print('{:<10}{:>20}'.format('', 'submissions per second'))
+    for name, raw_rows in (('rows', False), ('raw', True)):
+        seconds = min(timeit.repeat(workload(OMPDAL(db, CONF, raw_rows=raw_rows)), number=3, repeat=3)) / 3
+        print('{:<10}{:>20.1f}'.format(name, submissions / seconds))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
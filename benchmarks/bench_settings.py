@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark memory per item and lookup throughput of OMPSettings.
+
+Compares the original dict-of-dicts implementation with the slotted OMPSettings. Run from the repository root:
+
+    python benchmarks/bench_settings.py [number of items]
+"""
+import sys
+import timeit
+import tracemalloc
+from collections import namedtuple
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from ompdal import OMPSettings
+
+SettingRow = namedtuple('SettingRow', ['locale', 'setting_name', 'setting_value'])
+
+SETTING_NAMES = ['title', 'subtitle', 'prefix', 'abstract', 'familyName', 'givenName', 'affiliation',
+                 'biography', 'pub-id::doi', 'copyrightHolder', 'copyrightYear', 'licenseURL']
+LOCALES = ['de_DE', 'en_US', '']
+
+
+class LegacyOMPSettings:
+    """
+    OMPSettings as implemented before the slotted version, for comparison.
+    """
+    def __init__(self, rows=[]):
+        self._settings = dict()
+        for row in rows:
+            self._settings.setdefault(row.setting_name, {})[row.locale] = row.setting_value
+
+    def getLocalizedValue(self, setting_name, locale, fallback="en_US"):
+        if setting_name in self._settings:
+            value = self._settings[setting_name].get(locale, "")
+            if not value:
+                value = self._settings[setting_name].get(fallback, "")
+            return value
+        else:
+            return ""
+
+
+def make_rows(item):
+    # Build new string objects for every row, like a database driver does
+    return [SettingRow(''.join(locale), ''.join(name), '{} {} {}'.format(name, locale, item))
+            for name in SETTING_NAMES for locale in LOCALES]
+
+
+def measure_memory(build, n):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # Rows are released after loading, only the settings objects stay in memory
+    items = [build(make_rows(i)) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n, items
+
+
+def main(n=2000):
+    implementations = [
+        ('legacy', LegacyOMPSettings),
+        ('slotted', OMPSettings),
+    ]
+    print('{:<10}{:>18}{:>22}'.format('', 'bytes per item', 'lookups per second'))
+    for name, build in implementations:
+        bytes_per_item, items = measure_memory(build, n)
+
+        def lookups():
+            for s in items:
+                s.getLocalizedValue('title', 'de_DE')
+                s.getLocalizedValue('familyName', 'de_DE')
+                s.getLocalizedValue('missing', 'de_DE')
+
+        seconds = min(timeit.repeat(lookups, number=5, repeat=3)) / 5
+        print('{:<10}{:>18.0f}{:>22.0f}'.format(name, bytes_per_item, 3 * n / seconds))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite fixtures for the benchmarks: an in-memory OMP database with a synthetic press.
+
+Requires web2py's gluon package on the Python path. The tables are created from the definitions in
+omptables, without the primary keys declared there (some of them do not match the OMP schema and
+would reject valid data).
+"""
+import datetime
+import sys
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from gluon import DAL
+
+from ompdal import ASSOC_TYPE_MONOGRAPH
+from omptables import define_omp_tables
+
+PRESS_ID = 1
+MONOGRAPH_TYPE_ID = 2
+CHAPTER_TYPE_ID = 3
+EDITOR_ID = 13
+AUTHOR_ID = 14
+LOCALES = ['de_DE', 'en_US']
+# Numbers of submissions, chapters per submission and formats per submission of the test presses
+SMALL_PRESS = dict(submissions=2, chapters=2, formats=2)
+LARGE_PRESS = dict(submissions=50, chapters=20, formats=3)
+
+
+class Conf(dict):
+    """
+    Minimal stand-in for gluon's AppConfig.
+    """
+
+    def take(self, key, cast=None):
+        value = self[key]
+        return cast(value) if cast else value
+
+
+CONF = Conf({
+    'web.application': 'benchmarks',
+    'omp.press_id': str(PRESS_ID),
+    'omp.monograph_type_id': str(MONOGRAPH_TYPE_ID),
+    'omp.editor_id': str(EDITOR_ID),
+    'omp.author_ids': str(AUTHOR_ID),
+})
+
+
+def create_db(uri='sqlite:memory'):
+    """
+    Create a DAL instance with all OMP tables.
+    """
+    db = DAL(uri)
+    define_omp_tables(db)
+    for table in db:
+        columns = []
+        for field in table:
+            field_type = 'integer' if field.type.startswith('reference') else field.type.split(' ')[0]
+            column_type = db._adapter.types.get(field_type, 'TEXT')
+            if '%' in column_type:
+                column_type = column_type % dict(length=field.length)
+            columns.append('{} {}'.format(field._rname, column_type))
+        db.executesql('CREATE TABLE {} ({})'.format(table._rname, ', '.join(columns)))
+    return db
+
+
+def populate_press(db, submissions=10, chapters=10, authors=4, formats=2, revisions=2):
+    """
+    Fill the database with a press of published monographs, each with settings, authors, publication
+    formats (alternating digital 'PDF' and physical 'Print', numbered from the third format on),
+    chapters and several revisions of full book and chapter files for the first format.
+    """
+    now = datetime.datetime(2020, 1, 1)
+
+    def settings(table, id_field, item_id, **values):
+        for name, value in values.items():
+            for locale in LOCALES:
+                table.insert(**{id_field: item_id, 'locale': locale, 'setting_name': name,
+                                'setting_value': '{} {} {}'.format(value, locale, item_id)})
+
+    db.press_settings.insert(press_id=PRESS_ID, locale='', setting_name='location', setting_value='Heidelberg')
+    db.series.insert(series_id=1, press_id=PRESS_ID, path='series', seq=1)
+    settings(db.series_settings, 'series_id', 1, title='Series')
+    db.series_settings.insert(series_id=1, locale='', setting_name='sortOption', setting_value='seriesPosition-1')
+    db.categories.insert(category_id=1, context_id=PRESS_ID, path='category')
+    settings(db.category_settings, 'category_id', 1, title='Category')
+    db.genres.insert(genre_id=MONOGRAPH_TYPE_ID, context_id=PRESS_ID, entry_key='MANUSCRIPT')
+    db.genres.insert(genre_id=CHAPTER_TYPE_ID, context_id=PRESS_ID, entry_key='CHAPTER')
+
+    author_id = chapter_id = file_id = format_id = 1
+    for submission_id in range(1, submissions + 1):
+        db.submissions.insert(submission_id=submission_id, locale=LOCALES[0], context_id=PRESS_ID, series_id=1,
+                              series_position=str(submission_id), status=3, date_submitted=now,
+                              date_status_modified=now)
+        db.published_submissions.insert(published_submission_id=submission_id, submission_id=submission_id,
+                                        date_published=now + datetime.timedelta(days=submission_id))
+        db.submission_categories.insert(submission_id=submission_id, category_id=1)
+        settings(db.submission_settings, 'submission_id', submission_id, title='Title', abstract='Abstract')
+
+        submission_authors = []
+        for seq in range(authors):
+            db.authors.insert(author_id=author_id, submission_id=submission_id, seq=seq,
+                              user_group_id=AUTHOR_ID if seq else EDITOR_ID, include_in_browse=1)
+            settings(db.author_settings, 'author_id', author_id, givenName='Given', familyName='Family')
+            submission_authors.append(author_id)
+            author_id += 1
+
+        db.event_log.insert(log_id=submission_id, assoc_type=ASSOC_TYPE_MONOGRAPH, assoc_id=submission_id,
+                            date_logged=now, message='submission.event.metadataPublished')
+
+        format_ids = []
+        for i in range(formats):
+            physical = i % 2
+            name = ('Print' if physical else 'PDF') + (' {}'.format(i + 1) if i >= 2 else '')
+            db.publication_formats.insert(publication_format_id=format_id, submission_id=submission_id,
+                                          physical_format=physical, is_available=1, is_approved=1)
+            db.publication_format_settings.insert(publication_format_id=format_id, locale=LOCALES[0],
+                                                  setting_name='name', setting_value=name)
+            db.publication_dates.insert(publication_date_id=format_id, publication_format_id=format_id,
+                                        role='01', date='20200101', date_format='00')
+            db.identification_codes.insert(identification_code_id=format_id, publication_format_id=format_id,
+                                           code=15, value='978-3-00-{:06d}'.format(format_id))
+            db.markets.insert(market_id=format_id, publication_format_id=format_id, price='10,00')
+            format_ids.append(format_id)
+            format_id += 1
+
+        def files(genre_id):
+            for revision in range(1, revisions + 1):
+                db.submission_files.insert(file_id=file_id, revision=revision, submission_id=submission_id,
+                                           genre_id=genre_id, file_stage=10, assoc_id=format_ids[0], assoc_type=521,
+                                           original_file_name='file.pdf', file_type='application/pdf',
+                                           date_uploaded=now, date_modified=now)
+
+        files(MONOGRAPH_TYPE_ID)
+        file_id += 1
+        for seq in range(chapters):
+            db.submission_chapters.insert(chapter_id=chapter_id, submission_id=submission_id, seq=seq)
+            settings(db.submission_chapter_settings, 'chapter_id', chapter_id, title='Chapter')
+            db.submission_chapter_authors.insert(author_id=submission_authors[seq % authors], chapter_id=chapter_id,
+                                                 submission_id=submission_id, seq=0)
+            files(CHAPTER_TYPE_ID)
+            db.submission_file_settings.insert(file_id=file_id, locale='', setting_name='chapterID',
+                                               setting_value=str(chapter_id))
+            file_id += 1
+            chapter_id += 1
+    db.commit()
+    return db
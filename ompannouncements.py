@@ -14,10 +14,10 @@ from ompdal import OMPDAL
 
 class Announcements:
 
-    def __init__(self, conf, db, locale):
+    def __init__(self, conf, db, locale, press_config=None):
         self.locale = locale
         self.conf = conf
-        self.ompdal = OMPDAL(db, conf)
+        self.ompdal = OMPDAL(db, conf, press_config=press_config)
         self.press_id = int(conf.take('omp.press_id'))
         self.press_settings = self.ompdal.getPressSettings(self.press_id)
 
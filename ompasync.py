@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+'''
+Copyright (c) 2026 Heidelberg University Library
+Distributed under the GNU GPL v3. For full terms see the file
+LICENSE.md
+'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+# Default number of worker threads, i.e. of queries running at the same time
+DEFAULT_MAX_WORKERS = 4
+
+
+class AsyncOMPDAL:
+    """
+    asyncio interface for OMPDAL. All getters of the wrapped OMPDAL are available as coroutines, which
+    run the getter in a thread pool, so that independent queries can be awaited concurrently:
+
+        aompdal = AsyncOMPDAL(OMPDAL(db, conf))
+        settings, formats, series = await asyncio.gather(
+            aompdal.getSubmissionSettings(submission_id),
+            aompdal.getPublicationFormatsBySubmission(submission_id),
+            aompdal.getSeriesBySubmissionId(submission_id),
+        )
+        aompdal.close()
+
+    pydal keeps one connection per thread. Every call takes a connection in its worker thread and
+    releases it afterwards (with a rollback, since OMPDAL only reads), so the DAL should be created
+    with a pool_size to reuse connections. Does not work with in-memory SQLite databases, which are
+    not shared between connections.
+    """
+
+    def __init__(self, ompdal, executor=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.ompdal = ompdal
+        self._own_executor = executor is None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers) if executor is None else executor
+
+    def __getattr__(self, name):
+        attr = getattr(self.ompdal, name)
+        if not name.startswith('get') or not callable(attr):
+            return attr
+
+        @wraps(attr)
+        async def async_getter(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(self._call, name, args, kwargs))
+
+        # Store the wrapper, so that __getattr__ is only called once per getter
+        self.__dict__[name] = async_getter
+        return async_getter
+
+    def _call(self, name, args, kwargs):
+        try:
+            return getattr(self.ompdal, name)(*args, **kwargs)
+        finally:
+            # Return the worker thread's connection to the pool
+            self.ompdal.db._adapter.close('rollback')
+
+    def close(self):
+        """
+        Shut down the thread pool, if it has been created by this instance.
+        """
+        if self._own_executor:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+'''
+Copyright (c) 2026 Heidelberg University Library
+Distributed under the GNU GPL v3. For full terms see the file
+LICENSE.md
+'''
+import hashlib
+import inspect
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from pydal.objects import Expression, Row, Rows
+
+from ompdal import OMPItem, OMPSettings, RawRows, ReadOnlyOMPItem, ASSOC_TYPE_MONOGRAPH, getRowType
+
+# Time to live in seconds for getters of rarely changing items
+DEFAULT_TTLS = {
+    'getPresses': 3600,
+    'getPress': 3600,
+    'getPressSettings': 3600,
+    'getSeries': 3600,
+    'getSeriesByPress': 3600,
+    'getSeriesByPathAndPress': 3600,
+    'getSeriesSettings': 3600,
+    'getCategory': 3600,
+    'getCategoriesByPress': 3600,
+    'getCategoryByPathAndPress': 3600,
+    'getCategorySettings': 3600,
+    'getGenreById': 3600,
+    'getGenresByPress': 3600,
+    'getPluginSettingsByNameAndPress': 3600,
+}
+
+# Getters whose results do not depend on submissions and are not invalidated by submission events
+SUBMISSION_INDEPENDENT_GETTERS = set(DEFAULT_TTLS) | {
+    'getAnnouncementWithSettings',
+    'getAnnouncementsByPress',
+    'getAnnouncementsByPressGroupedByYearAndMonth',
+    'getAnnouncementsByType',
+    'getAnnouncementSettings',
+    'getAnnouncementType',
+    'getAnnouncementTypeSettings',
+    'getPressSettingsByIds',
+    'getSeriesSettingsByIds',
+    'getCategorySettingsByIds',
+    'getSeriesEditors',
+    'getUserSettings',
+}
+
+# Getters used for cache invalidation, which must always query the database
+UNCACHED_GETTERS = {'getLatestEventLogId', 'getEventLogEntriesSince'}
+
+# Time to live of the generation entries used for invalidation
+GENERATION_TTL = 30 * 24 * 3600
+# Event log messages of changes to what is published, which invalidate the cached catalog listings
+CATALOG_EVENT_MESSAGES = {
+    'submission.event.metadataPublished',
+    'submission.event.metadataUnpublished',
+    'submission.event.publicationFormatPublished',
+    'submission.event.publicationFormatUnpublished',
+    'submission.event.publicationFormatMadeAvailable',
+    'submission.event.publicationFormatMadeUnavailable',
+}
+# Cache key of the id of the last processed event log entry
+WATERMARK_KEY = 'ompdal:event_log_watermark'
+
+_ROWS, _ROW, _ITEM, _SETTINGS, _LIST, _TUPLE, _DICT, _ORDERED_DICT, _RAW_ROW, _RAW_ROWS = range(10)
+
+
+def _freeze(value):
+    """
+    Convert a getter result into a structure of plain, picklable values without database references.
+    """
+    if isinstance(value, Rows):
+        return _ROWS, value.colnames, value.compact, [r.as_dict() for r in value.records]
+    if isinstance(value, Row):
+        return _ROW, value.as_dict()
+    if isinstance(value, OMPItem):
+        return (_ITEM, _freeze(value.attributes), _freeze(value.settings), _freeze(value.associated_items),
+                isinstance(value, ReadOnlyOMPItem))
+    if isinstance(value, OMPSettings):
+        return _SETTINGS, dict((k, dict(v)) for k, v in value._settings.items())
+    if isinstance(value, RawRows):
+        return _RAW_ROWS, [_freeze(v) for v in value]
+    if isinstance(value, list):
+        return _LIST, [_freeze(v) for v in value]
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        return _RAW_ROW, value._fields, list(value)
+    if isinstance(value, tuple):
+        return _TUPLE, [_freeze(v) for v in value]
+    if isinstance(value, OrderedDict):
+        return _ORDERED_DICT, [(k, _freeze(v)) for k, v in value.items()]
+    if isinstance(value, Mapping):
+        return _DICT, [(k, _freeze(v)) for k, v in value.items()]
+    return value
+
+
+_COLUMN = re.compile(r'^"?(\w+)"?\."?(\w+)"?$')
+
+
+def _thaw_fields(db, colnames):
+    """
+    Get the fields of the columns of cached Rows. Columns of expressions (e.g. counts) are represented by
+    plain expressions, like in the result of a select.
+    """
+    fields = []
+    for col in colnames:
+        m = _COLUMN.match(col)
+        table = db[m.group(1)] if m and m.group(1) in db.tables else None
+        if table is not None and m.group(2) in table.fields:
+            fields.append(table[m.group(2)])
+        else:
+            fields.append(Expression(db, col))
+    return fields
+
+
+def _thaw_row(d):
+    return Row(dict((k, Row(v) if isinstance(v, dict) else v) for k, v in d.items()))
+
+
+def _thaw(value, db):
+    """
+    Rebuild a getter result from its frozen form. Every call returns new objects, so callers may
+    modify the result without affecting the cached entry.
+    """
+    if not isinstance(value, tuple):
+        return value
+    kind = value[0]
+    if kind == _ROWS:
+        return Rows(db, [_thaw_row(r) for r in value[3]], value[1], compact=value[2],
+                    fields=_thaw_fields(db, value[1]))
+    if kind == _ROW:
+        return _thaw_row(value[1])
+    if kind == _ITEM:
+        item = OMPItem(_thaw(value[1], db), _thaw(value[2], db), _thaw(value[3], db))
+        return item.readOnly() if value[4] else item
+    if kind == _SETTINGS:
+        settings = OMPSettings()
+        settings._settings = dict((k, dict(v)) for k, v in value[1].items())
+        return settings
+    if kind == _LIST:
+        return [_thaw(v, db) for v in value[1]]
+    if kind == _RAW_ROWS:
+        return RawRows(_thaw(v, db) for v in value[1])
+    if kind == _RAW_ROW:
+        return getRowType(tuple(value[1]))(*value[2])
+    if kind == _TUPLE:
+        return tuple(_thaw(v, db) for v in value[1])
+    if kind == _ORDERED_DICT:
+        return OrderedDict((k, _thaw(v, db)) for k, v in value[1])
+    if kind == _DICT:
+        return dict((k, _thaw(v, db)) for k, v in value[1])
+    raise ValueError('Unknown cache entry type: {}'.format(kind))
+
+
+class MemoryCache:
+    """
+    In-process cache with time based expiry and size-bounded LRU eviction.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileCache:
+    """
+    Cache in a local directory, which can be shared by several worker processes.
+
+    Every entry is stored as a pickled file. Reading an entry updates its modification time, so the
+    least recently used entries are removed first, when the number of entries exceeds max_entries.
+
+    Unpickling executes code, so the directory must only be writable by the user of the application:
+    it is created with mode 0700, and an existing directory writable by group or others is rejected.
+    Do not use a shared directory like /tmp.
+    """
+
+    def __init__(self, directory, max_entries=10000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory, mode=0o700)
+        if os.stat(directory).st_mode & 0o022:
+            raise ValueError('Cache directory {} is writable by group or others'.format(directory))
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time.time():
+            self.delete(key)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, ttl):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + ttl, value), f, pickle.HIGHEST_PROTOCOL)
+        # Atomic replace, concurrent readers see either the old or the new entry
+        os.replace(tmp_path, self._path(key))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        entries.sort()
+        for mtime, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+class MemcachedCache:
+    """
+    Cache backed by a memcached-compatible client (e.g. python-memcached or pymemcache), which can be
+    shared by several worker processes and hosts.
+
+    The client must provide get(key), set(key, value, ttl) and delete(key) and is only given byte
+    strings. Eviction of least recently used entries is left to the server.
+    """
+
+    def __init__(self, client, prefix='ompdal'):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key):
+        # memcached keys are limited to 250 characters without whitespace
+        return '{}:{}'.format(self.prefix, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        data = self.client.get(self._key(key))
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        self.client.set(self._key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def clear(self):
+        """
+        Does nothing: flushing would remove the entries of all other users of the memcached instance.
+        Entries expire with their ttl, or use CachedOMPDAL.invalidateSubmission.
+        """
+
+
+class CachedOMPDAL:
+    """
+    Read-through cache layer for OMPDAL.
+
+    Getters (methods starting with 'get') are cached by method name and arguments. The time to live is
+    taken from ttls (method name -> seconds) with default_ttl for all other getters. Getters with a
+    time to live of 0 are not cached. All other attributes are passed through to the wrapped OMPDAL.
+
+    Entries of getters depending on submissions carry a generation token, which is stored in the cache
+    backend as well. Calls with a submission_id argument use the generation of that submission, all
+    other calls the generation of the whole catalog. invalidateSubmission() replaces these tokens, which
+    makes the affected entries unreachable for all workers sharing the backend. All entries carry an
+    epoch token as well, which invalidateAll() replaces.
+
+    Example:
+
+        ompdal = CachedOMPDAL(OMPDAL(db, conf), cache=FileCache('/var/cache/omp-portal'))
+        press_settings = ompdal.getPressSettings(press_id)
+    """
+
+    def __init__(self, ompdal, cache=None, ttls=None, default_ttl=0):
+        self.ompdal = ompdal
+        self.cache = MemoryCache() if cache is None else cache
+        self.ttls = dict(DEFAULT_TTLS) if ttls is None else ttls
+        self.default_ttl = default_ttl
+
+    def __getattr__(self, name):
+        attr = getattr(self.ompdal, name)
+        ttl = self.ttls.get(name, self.default_ttl)
+        if not name.startswith('get') or not callable(attr) or ttl <= 0 or name in UNCACHED_GETTERS:
+            return attr
+        signature = inspect.signature(attr)
+
+        def cached_getter(*args, **kwargs):
+            # The epoch is part of every key, renewing it invalidates all entries
+            key = '{}#{}'.format(self.getKey(name, args, kwargs), self.getGeneration('epoch'))
+            scope = self._getScope(name, signature, args, kwargs)
+            if scope:
+                key = '{}@{}'.format(key, self.getGeneration(scope))
+            entry = self.cache.get(key)
+            if entry is None:
+                # Look the getter up again, it may be shadowed by an instance attribute (see ompprofile)
+                value = getattr(self.ompdal, name)(*args, **kwargs)
+                self.cache.set(key, (_freeze(value),), ttl)
+                return value
+            return _thaw(entry[0], self.ompdal.db)
+
+        cached_getter.__name__ = name
+        cached_getter.__doc__ = attr.__doc__
+        # Store the wrapper, so that __getattr__ is only called once per getter
+        self.__dict__[name] = cached_getter
+        return cached_getter
+
+    def getKey(self, name, args, kwargs):
+        """
+        Build the cache key for a getter call.
+        """
+        return 'ompdal:{}:{!r}:{!r}'.format(name, args, sorted(kwargs.items()))
+
+    def _getScope(self, name, signature, args, kwargs):
+        """
+        Get the invalidation scope of a getter call: None, 'submission:<id>' or 'catalog'.
+        """
+        if name in SUBMISSION_INDEPENDENT_GETTERS:
+            return None
+        try:
+            submission_id = signature.bind(*args, **kwargs).arguments.get('submission_id')
+        except TypeError:
+            submission_id = None
+        if submission_id is None:
+            return 'catalog'
+        return 'submission:{}'.format(int(submission_id) if str(submission_id).isdigit() else submission_id)
+
+    def getGeneration(self, scope):
+        """
+        Get the current generation token of an invalidation scope.
+        """
+        generation = self.cache.get('ompdal:generation:' + scope)
+        if generation is None:
+            # Never reuse an old token, if the entry has been evicted
+            generation = self._renewGeneration(scope)
+        return generation
+
+    def _renewGeneration(self, scope):
+        generation = uuid.uuid4().hex
+        self.cache.set('ompdal:generation:' + scope, generation, GENERATION_TTL)
+        return generation
+
+    def invalidateSubmission(self, submission_id, catalog=True):
+        """
+        Invalidate all cached entries depending on the given submission and, if catalog is True, all
+        entries of getters without submission_id argument (e.g. listings), which may include it.
+        """
+        self._renewGeneration('submission:{}'.format(int(submission_id)))
+        if catalog:
+            self._renewGeneration('catalog')
+
+    def invalidateAll(self):
+        """
+        Invalidate all cached entries.
+        """
+        self._renewGeneration('epoch')
+
+
+class EventLogInvalidator:
+    """
+    Invalidate cached entries of submissions, for which new entries have been written to the OMP event log.
+
+    The event log is polled for entries with a log id above the last seen one (the watermark). The
+    watermark is stored in the cache backend next to the generation tokens, so entries written while
+    all workers were stopped (e.g. during a deploy) are processed by the next poll. Without a stored
+    watermark, the first poll invalidates all entries. Entries of getters without submission_id
+    argument (the catalog) are only invalidated for events in CATALOG_EVENT_MESSAGES, which change what
+    is published. Call maybePoll() at the beginning of
+    each request, it polls at most every interval seconds. This allows long cache lifetimes while new
+    publications show up within seconds.
+
+    Example:
+
+        ompdal = CachedOMPDAL(OMPDAL(db, conf), cache=FileCache('/var/cache/omp-portal'), default_ttl=86400)
+        invalidator = EventLogInvalidator(ompdal, interval=10)
+        invalidator.maybePoll()
+    """
+
+    def __init__(self, cached_ompdal, interval=10):
+        self.cached_ompdal = cached_ompdal
+        self.interval = interval
+        self.watermark = None
+        self._last_poll = 0
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """
+        Read new event log entries and invalidate the affected submissions.
+
+        Returns the list of invalidated submission ids.
+        """
+        # Use the wrapped OMPDAL, the event log must never be cached
+        ompdal = self.cached_ompdal.ompdal
+        cache = self.cached_ompdal.cache
+        with self._lock:
+            self._last_poll = time.time()
+            stored = cache.get(WATERMARK_KEY)
+            if stored is not None:
+                self.watermark = stored if self.watermark is None else max(self.watermark, stored)
+            if self.watermark is None:
+                # Unknown which entries have been missed, discard all entries
+                watermark = ompdal.getLatestEventLogId()
+                self.cached_ompdal.invalidateAll()
+                self.watermark = watermark
+                cache.set(WATERMARK_KEY, self.watermark, GENERATION_TTL)
+                return []
+            submission_ids, catalog_ids = set(), set()
+            watermark = self.watermark
+            for row in ompdal.getEventLogEntriesSince(self.watermark, assoc_type=ASSOC_TYPE_MONOGRAPH):
+                submission_ids.add(row.assoc_id)
+                if row.message in CATALOG_EVENT_MESSAGES:
+                    catalog_ids.add(row.assoc_id)
+                watermark = max(watermark, row.log_id)
+            # Store the watermark only after invalidating, so that a failure does not lose events
+            for submission_id in submission_ids:
+                self.cached_ompdal.invalidateSubmission(submission_id, catalog=submission_id in catalog_ids)
+            self.watermark = watermark
+            cache.set(WATERMARK_KEY, self.watermark, GENERATION_TTL)
+        return sorted(submission_ids)
+
+    def maybePoll(self):
+        """
+        Poll the event log, if the last poll is older than the configured interval.
+        """
+        if time.time() - self._last_poll >= self.interval:
+            return self.poll()
+        return []
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+'''
+Copyright (c) 2026 Heidelberg University Library
+Distributed under the GNU GPL v3. For full terms see the file
+LICENSE.md
+'''
+import threading
+import time
+
+from ompdal import OMPDAL, OMPSettings, parseConfIds
+
+# Seconds after which a press configuration is reloaded from the database
+REFRESH_INTERVAL = 300
+# Keys of the application config holding ids of user groups and genres
+CONF_ID_KEYS = ('omp.author_ids', 'omp.editor_id', 'omp.monograph_type_id', 'omp.epub_monograph_type_id',
+                'omp.review_type_id')
+
+_configurations = {}
+_configurations_lock = threading.Lock()
+
+
+class PressConfiguration:
+    """
+    Snapshot of the configuration of a press: press settings, plugin settings and genres from the
+    database, and the ids of user groups and genres from the application config.
+
+    Snapshots are shared by all requests of a worker process (see getPressConfiguration) and must not
+    be modified. Pass them to OMPDAL(db, conf, press_config=...) to answer getPressSettings,
+    getPluginSettingsByNameAndPress and getGenresByPress for the press and getConfIds from memory.
+    """
+
+    def __init__(self, press_id, press_settings, plugin_settings, genres, conf_ids):
+        self.press_id = press_id
+        self.press_settings = press_settings
+        self.plugin_settings = plugin_settings
+        self.genres = genres
+        self.conf_ids = conf_ids
+        self.settings = OMPSettings(press_settings)
+        self.loaded = time.time()
+
+    @classmethod
+    def load(cls, ompdal, press_id):
+        """
+        Load the configuration of a press with the given OMPDAL.
+        """
+        return cls(int(press_id),
+                   ompdal.getPressSettings(press_id),
+                   ompdal.getPluginSettingsByPress(press_id),
+                   ompdal.getGenresByPress(press_id),
+                   dict((key, parseConfIds(ompdal.conf, key)) for key in CONF_ID_KEYS))
+
+    def getPluginSettings(self, plugin_name):
+        """
+        Get the settings of a plugin as dictionary setting name -> value.
+        """
+        return dict((r.setting_name, r.setting_value) for r in self.plugin_settings if r.plugin_name == plugin_name)
+
+    def isExpired(self, max_age):
+        return time.time() - self.loaded > max_age
+
+
+def getPressConfiguration(db, conf, press_id=None, max_age=REFRESH_INTERVAL):
+    """
+    Get the configuration snapshot of a press (default: omp.press_id from the application config). The
+    snapshot is loaded at most once per max_age seconds in each process.
+    """
+    press_id = int(conf.take('omp.press_id') if press_id is None else press_id)
+    key = (db._uri, press_id)
+    press_config = _configurations.get(key)
+    if press_config is None or press_config.isExpired(max_age):
+        with _configurations_lock:
+            press_config = _configurations.get(key)
+            if press_config is None or press_config.isExpired(max_age):
+                press_config = PressConfiguration.load(OMPDAL(db, conf), press_id)
+                _configurations[key] = press_config
+    return press_config
@@ -45,11 +45,14 @@ class OMPCSL():
             raise ValueError("Unknown submission_id: " + submission_id)
         submission = OMPItem(submission, OMPSettings(self.db.getSubmissionSettings(submission_id)))
 
-        editors = [OMPItem(e, OMPSettings(self.db.getAuthorSettings(e.author_id))) for e in
-                   self.db.getEditorsBySubmission(submission_id)]
+        editor_rows = list(self.db.getEditorsBySubmission(submission_id))
+        author_rows = list(self.db.getActualAuthorsBySubmission(submission_id, filter_browse=True))
+        # Load settings of all contributors at once
+        contributor_settings = self.db.getAuthorSettingsByIds([c.author_id for c in editor_rows + author_rows])
 
-        authors = [OMPItem(a, OMPSettings(self.db.getAuthorSettings(a.author_id))) for a in
-                                      self.db.getActualAuthorsBySubmission(submission_id, filter_browse=True)]
+        editors = [OMPItem(e, contributor_settings[e.author_id]) for e in editor_rows]
+
+        authors = [OMPItem(a, contributor_settings[a.author_id]) for a in author_rows]
 
         date_published = None
         date_first_published = None
@@ -4,49 +4,433 @@ Copyright (c) 2015 Heidelberg University Library
 Distributed under the GNU GPL v3. For full terms see the file
 LICENSE.md
 '''
+import base64
+import datetime
+import json
 import re
-from operator import itemgetter
+from functools import reduce
+from operator import or_
 import logging
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from sys import intern
+from threading import Lock
+from types import MappingProxyType
+from weakref import WeakKeyDictionary
 
 DOI_SETTING_NAME = 'pub-id::doi'
+# See OMP source file : lib/pkp/classes/core/PKPApplication.inc.php
+ASSOC_TYPE_MONOGRAPH = 1048585
+# Prepared statements per database connection, for drivers that support them
+MAX_PREPARED_STATEMENTS = 64
+_prepared_statements = WeakKeyDictionary()
+_prepared_statements_lock = Lock()
+# Default number of rows loaded at a time by the iter* methods
+CHUNK_SIZE = 1000
 
 
 class OMPSettings:
-    def __init__(self, rows=[]):
-        self._settings = dict()
+    # Setting names and locales repeat for every item, so they are interned to share one string object
+    __slots__ = ('_settings',)
+
+    def __init__(self, rows=()):
+        settings = dict()
         for row in rows:
-            self._settings.setdefault(row.setting_name, {})[row.locale] = row.setting_value
+            locale = intern(row.locale) if row.locale else row.locale
+            settings.setdefault(intern(row.setting_name), {})[locale] = row.setting_value
+        self._settings = settings
 
     def getLocalizedValue(self, setting_name, locale, fallback="en_US"):
-        if setting_name in self._settings:
-            value = self._settings[setting_name].get(locale, "")
-            if not value:
-                value = self._settings[setting_name].get(fallback, "")
-            return value
-        else:
+        values = self._settings.get(setting_name)
+        if values is None:
             return ""
+        return values.get(locale) or values.get(fallback, "")
 
     def getValues(self, setting_name):
         return self._settings.get(setting_name, {})
 
+    def readOnly(self):
+        """
+        Get a read-only copy of the settings.
+        """
+        return ReadOnlyOMPSettings(self)
+
+
+class ReadOnlyOMPSettings(OMPSettings):
+    """
+    OMPSettings, which cannot be modified.
+    """
+    __slots__ = ()
+
+    def __init__(self, settings):
+        object.__setattr__(self, '_settings', MappingProxyType(dict(
+            (name, MappingProxyType(dict(values))) for name, values in settings._settings.items())))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('OMPSettings are read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('OMPSettings are read-only')
+
+    def readOnly(self):
+        return self
+
+
+@lru_cache(maxsize=None)
+def getRowType(columns):
+    """
+    Get a lightweight row class for the given column names, which supports access by attribute
+    (row.file_id), by column name (row['file_id']) and by index like a tuple.
+    """
+    names = [c.rsplit('.', 1)[-1] for c in columns]
+    base = namedtuple('OMPRow', names, rename=True)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def as_dict(self):
+        return self._asdict()
+
+    return type('OMPRow', (base,), {'__slots__': (), '__getitem__': __getitem__, 'get': get, 'as_dict': as_dict})
+
+
+@lru_cache(maxsize=1024)
+def formatPlaceholders(sql, paramstyle):
+    """
+    Replace the '?' placeholders in the SQL string with the placeholders of the driver's paramstyle.
+    """
+    if paramstyle in ('format', 'pyformat'):
+        return sql.replace('%', '%%').replace('?', '%s')
+    return sql
+
+
+def getSeriesPositionSortKey(series_position):
+    """
+    Get the key for sorting submissions by their position in a series: the numbers in the position,
+    with positions of supplements ('Beiheft ...') after all others.
+    """
+    series_position = series_position or ''
+    prefix = 1 if series_position.startswith('Beiheft') else 0
+    return (prefix,) + tuple(int(n) for n in re.findall(r'\d+', series_position))
+
+
+def encodeCursor(values):
+    """
+    Encode the key values of the last row of a page as opaque cursor string.
+    """
+    def encode(v):
+        if isinstance(v, datetime.datetime):
+            return {'datetime': v.isoformat()}
+        if isinstance(v, datetime.date):
+            return {'date': v.isoformat()}
+        return v
+
+    data = json.dumps([encode(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodeCursor(cursor):
+    """
+    Decode a cursor created by encodeCursor. Raises ValueError, if the cursor is invalid.
+    """
+    def decode(v):
+        if isinstance(v, dict) and 'datetime' in v:
+            return datetime.datetime.fromisoformat(v['datetime'])
+        if isinstance(v, dict) and 'date' in v:
+            return datetime.date.fromisoformat(v['date'])
+        return v
+
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode('utf-8'))
+        return [decode(v) for v in values]
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ValueError('Invalid cursor: {}'.format(cursor)) from e
+
+
+def parseConfIds(conf, key):
+    """
+    Get the list of ids configured under key as comma-separated integers, None if the key is missing
+    or invalid.
+    """
+    try:
+        return [int(i) for i in str(conf.take(key)).split(',')]
+    except:
+        return None
+
+
+class RawRows(list):
+    """
+    List of lightweight rows (see getRowType) returned by OMPDAL in raw row mode. Supports the most
+    frequently used methods of pydal Rows.
+    """
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return RawRows(list.__getitem__(self, key))
+        return list.__getitem__(self, key)
+
+    def first(self):
+        return self[0] if self else None
+
+    def last(self):
+        return self[-1] if self else None
+
+    def find(self, f):
+        return RawRows(row for row in self if f(row))
+
+    def as_list(self):
+        return [row.as_dict() for row in self]
+
 
 class OMPItem:
-    def __init__(self, row, settings=OMPSettings(), associated_items={}):
+    """
+    An OMP item row with its settings and associated items (e.g. the chapters of a submission).
+
+    Each item gets its own settings and associated items, unless they are given explicitly.
+    """
+    __slots__ = ('attributes', 'settings', 'associated_items')
+
+    def __init__(self, row, settings=None, associated_items=None):
         self.attributes = row
-        self.settings = settings
-        self.associated_items = associated_items
+        self.settings = OMPSettings() if settings is None else settings
+        self.associated_items = {} if associated_items is None else associated_items
+
+    @classmethod
+    def fromTuple(cls, columns, values, settings=None, associated_items=None):
+        """
+        Create an item from a raw result tuple (e.g. from db.executesql) and the list of column names.
+        """
+        return cls(getRowType(tuple(columns))(*values), settings, associated_items)
+
+    def readOnly(self, _copies=None):
+        """
+        Get a read-only copy of the item. Settings and associated items are copied recursively: lists
+        become tuples, dictionaries read-only mappings and items and settings read-only copies. Rows
+        (the attributes and Rows in associated items) are shared with the original item and must not
+        be modified.
+        """
+        copies = {} if _copies is None else _copies
+        if id(self) not in copies:
+            copies[id(self)] = ReadOnlyOMPItem(self.attributes, self.settings, {})
+            object.__setattr__(copies[id(self)], 'associated_items', MappingProxyType(dict(
+                (k, _readOnlyValue(v, copies)) for k, v in self.associated_items.items())))
+        return copies[id(self)]
+
+
+def _readOnlyValue(value, copies):
+    if isinstance(value, OMPItem):
+        return value.readOnly(copies)
+    if isinstance(value, OMPSettings):
+        return value.readOnly()
+    if type(value) in (list, tuple):
+        return tuple(_readOnlyValue(v, copies) for v in value)
+    if type(value) in (dict, OrderedDict, MappingProxyType):
+        return MappingProxyType(dict((k, _readOnlyValue(v, copies)) for k, v in value.items()))
+    return value
+
+
+class ReadOnlyOMPItem(OMPItem):
+    """
+    OMPItem, whose attributes cannot be reassigned and whose settings and associated items cannot be
+    modified, see OMPItem.readOnly.
+    """
+    __slots__ = ()
+
+    def __init__(self, row, settings=None, associated_items=None):
+        object.__setattr__(self, 'attributes', row)
+        object.__setattr__(self, 'settings', (OMPSettings() if settings is None else settings).readOnly())
+        object.__setattr__(self, 'associated_items', MappingProxyType(dict(
+            (k, _readOnlyValue(v, {})) for k, v in (associated_items or {}).items())))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('OMPItem is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('OMPItem is read-only')
+
+    def readOnly(self, _copies=None):
+        return self
 
 
 class OMPDAL:
     """
     A rudimentary database abstraction layer for the OMP database.
+
+    With raw_rows=True, list-style getters for settings, chapters, files and publication formats skip
+    the construction of pydal Rows and return RawRows of lightweight tuples instead.
+
+    With a press_config (see ompconfig), press settings, plugin settings and genres of that press as well
+    as the ids from the application config are taken from the snapshot instead of the database.
     """
 
-    def __init__(self, db, conf):
+    def __init__(self, db, conf, raw_rows=False, press_config=None):
         self.db = db
         self.conf = conf
+        self.raw_rows = raw_rows
+        self.press_config = press_config
+        self._conf_ids = dict(press_config.conf_ids) if press_config else {}
         self.logger = logging.getLogger(conf.take('web.application'))
+        # Lookup indexes built from the database, kept for the lifetime of the instance
+        self._indexes = {}
+
+    def getConfIds(self, key):
+        """
+        Get the ids configured under key in the application config as list of integers, None if the key
+        is missing. Parsed once per instance.
+        """
+        if key not in self._conf_ids:
+            self._conf_ids[key] = parseConfIds(self.conf, key)
+        return self._conf_ids[key]
+
+    def _isConfiguredPress(self, press_id):
+        return self.press_config is not None and str(press_id) == str(self.press_config.press_id)
+
+    def clearIndexes(self):
+        """
+        Discard all lookup indexes, so that they are rebuilt from the database on the next access.
+        """
+        self._indexes.clear()
+
+    @contextmanager
+    def profile(self, **kwargs):
+        """
+        Record getter calls and SQL statements within a with block, see ompprofile.QueryProfile.
+        """
+        from ompprofile import QueryProfile
+        profile = QueryProfile(self.logger, **kwargs)
+        profile.attach(self)
+        try:
+            yield profile
+        finally:
+            profile.detach(self)
+
+    def _executesql(self, sql, params=(), as_dict=False):
+        """
+        Execute raw SQL with bound parameters. Parameters are marked with '?' in the SQL string, values
+        must never be formatted into it. Statements are prepared once per connection if the driver
+        supports it (mysql-connector); sqlite3 caches them per connection itself.
+        """
+        adapter = self.db._adapter
+        sql = formatPlaceholders(sql, getattr(adapter.driver, 'paramstyle', 'qmark'))
+        cursor = self._getPreparedCursor(sql)
+        if cursor is None:
+            return self.db.executesql(sql, placeholders=list(params), as_dict=as_dict)
+
+        handlers = adapter._build_handlers_for_execution()
+        for handler in handlers:
+            handler.before_execute(sql)
+        cursor.execute(sql, tuple(params))
+        for handler in handlers:
+            handler.after_execute(sql)
+        rows = cursor.fetchall()
+        if as_dict:
+            columns = [d[0] for d in cursor.description]
+            return [dict(zip(columns, row)) for row in rows]
+        return rows
+
+    def _getPreparedCursor(self, sql):
+        """
+        Get a cursor with the statement prepared on the current connection, None if the driver does not
+        support prepared statements.
+        """
+        adapter = self.db._adapter
+        if getattr(adapter, 'driver_name', None) != 'mysqlconnector':
+            return None
+        connection = adapter.connection
+        with _prepared_statements_lock:
+            cursors = _prepared_statements.setdefault(connection, OrderedDict())
+        cursor = cursors.pop(sql, None)
+        if cursor is None:
+            try:
+                cursor = connection.cursor(prepared=True)
+            except TypeError:
+                # The connection's cursor factory has been replaced, e.g. by the cursor_buffered option
+                return None
+            if len(cursors) >= MAX_PREPARED_STATEMENTS:
+                cursors.popitem(last=False)[1].close()
+        cursors[sql] = cursor
+        return cursor
+
+    def _selectRaw(self, table, where, params=(), orderby=None):
+        """
+        Select all columns of a table with a raw SQL condition and return RawRows.
+        """
+        fields = list(table)
+        sql = 'SELECT {} FROM {} WHERE {}'.format(', '.join(f._rname for f in fields), table._rname, where)
+        if orderby:
+            sql += ' ORDER BY ' + orderby
+        row_type = getRowType(tuple(f.name for f in fields))
+        return RawRows(row_type(*r) for r in self._executesql(sql, params))
+
+    def _iterSelect(self, query, keys, fields, chunk_size):
+        """
+        Select rows in chunks of chunk_size with keyset pagination on the given key fields, usually the
+        primary key, and yield them one at a time. Memory use does not depend on the number of rows.
+        """
+        previous = None
+        while True:
+            q = query if previous is None else query & self._getKeysetQuery(keys, previous)
+            rows = self.db(q).select(*fields, orderby=reduce(or_, keys), limitby=(0, chunk_size))
+            for row in rows:
+                yield row
+            if len(rows) < chunk_size:
+                return
+            previous = [rows.last()[k] for k in keys]
+
+    @staticmethod
+    def _getKeysetQuery(keys, values, descending=False):
+        """
+        Get the query for rows following the given values of the key fields in key order.
+        """
+        follows = keys[0] < values[0] if descending else keys[0] > values[0]
+        if len(keys) == 1:
+            return follows
+        return follows | ((keys[0] == values[0]) & OMPDAL._getKeysetQuery(keys[1:], values[1:], descending))
+
+    @staticmethod
+    def _getNullableKeysetQuery(keys, values, descending):
+        """
+        Get the query for rows following the given values of the key fields in the order of _selectPage.
+        """
+        key, value = keys[0], values[0]
+        if len(keys) == 1:
+            return key < value if descending else key > value
+        if value is None:
+            # NULL is the smallest value: all other values follow it in ascending order, none in descending
+            follows = None if descending else key != None
+            equal = key == None
+        else:
+            follows = ((key < value) | (key == None)) if descending else key > value
+            equal = key == value
+        rest = equal & OMPDAL._getNullableKeysetQuery(keys[1:], values[1:], descending)
+        return rest if follows is None else follows | rest
+
+    def _getSettingsByIds(self, settings_table, id_field, ids):
+        """
+        Get settings for several items of the same type in a single query.
+
+        Returns a dictionary item id -> OMPSettings. Items without any settings are mapped to
+        empty OMPSettings, so every requested id can be looked up.
+        """
+        rows_by_id = dict((int(i), []) for i in ids)
+        if rows_by_id:
+            if self.raw_rows:
+                where = '{} IN ({})'.format(id_field, ', '.join('?' * len(rows_by_id)))
+                rows = self._selectRaw(settings_table, where, list(rows_by_id))
+            else:
+                q = settings_table[id_field].belongs(list(rows_by_id))
+                rows = self.db(q).select(settings_table.ALL)
+            for row in rows:
+                rows_by_id.setdefault(row[id_field], []).append(row)
+
+        return dict((i, OMPSettings(rows)) for i, rows in rows_by_id.items())
 
     def getAnnouncementWithSettings(self, announcement_id):
         """
@@ -75,14 +459,14 @@ class OMPDAL:
         sql = ' '.join([
             'Select a.date_posted date, a.announcement_id id, an_s.setting_value as title',
             'from announcements a, announcement_settings an_s',
-            'where assoc_id = {}'.format(press_id),
+            'where assoc_id = ?',
             'and an_s.announcement_id = a.announcement_id',
-            'and an_s.locale = "{}"'.format(locale),
-            'and an_s.setting_name = "title"',
+            'and an_s.locale = ?',
+            'and an_s.setting_name = ?',
             'order by date_posted desc'
         ])
         by_years_and_months = OrderedDict()
-        for row in self.db.executesql(sql, as_dict=True):
+        for row in self._executesql(sql, [press_id, locale, 'title'], as_dict=True):
             date = row['date']
             by_years_and_months.setdefault(date.year, OrderedDict()).setdefault(date.month, []).append(row)
         return by_years_and_months
@@ -143,11 +527,21 @@ class OMPDAL:
         """
         Get settings for a given press.
         """
+        if self._isConfiguredPress(press_id):
+            return self.press_config.press_settings
+        if self.raw_rows:
+            return self._selectRaw(self.db.press_settings, 'press_id = ?', [press_id])
         ps = self.db.press_settings
         q = (ps.press_id == press_id)
 
         return self.db(q).select(ps.ALL)
 
+    def getPressSettingsByIds(self, press_ids):
+        """
+        Get settings for several presses as dictionary press id -> OMPSettings.
+        """
+        return self._getSettingsByIds(self.db.press_settings, 'press_id', press_ids)
+
     def getSubmission(self, submission_id):
         """
         Get row for a given submission id.
@@ -166,6 +560,19 @@ class OMPDAL:
 
         return self.db(q).select(s.submission_id, s.series_id, s.date_submitted, s.series_position, orderby=~s.date_submitted)
 
+    def iterSubmissionsByPress(self, press_id, ignored_submission_id=-1, status=3, chunk_size=CHUNK_SIZE):
+        """
+        Iterate over the rows of getSubmissionsByPress ordered by submission id, loading chunk_size rows
+        at a time.
+        """
+        s = self.db.submissions
+        q = ((s.context_id == press_id)
+             & (s.submission_id != ignored_submission_id)
+             & (s.status == status)
+             )
+        fields = [s.submission_id, s.series_id, s.date_submitted, s.series_position]
+        return self._iterSelect(q, [s.submission_id], fields, chunk_size)
+
     def getSubmissionsRangeByPress(self, press_id, from_id, to_id, ignored_submission_id=-1, status=3):
         """
         Get submissions range in press with the given status (default: 3=published).
@@ -179,6 +586,21 @@ class OMPDAL:
         return self.db(q).select(s.submission_id, s.series_id, s.date_submitted, s.series_position,
                                  orderby=~s.date_submitted, limitby=(from_id, to_id), cacheable=True)
 
+    def getSubmissionsPageByPress(self, press_id, limit, cursor=None, ignored_submission_id=-1, status=3):
+        """
+        Get a page of at most limit submissions in press like getSubmissionsRangeByPress, with keyset
+        pagination: the cost does not depend on the position of the page.
+
+        Returns the rows and the cursor for the next page (None on the last page). Pass cursor=None for
+        the first page.
+        """
+        s = self.db.submissions
+        q = ((s.context_id == press_id)
+             & (s.submission_id != ignored_submission_id)
+             & (s.status == status)
+             )
+        fields = [s.submission_id, s.series_id, s.date_submitted, s.series_position]
+        return self._selectPage(q, [s.date_submitted, s.submission_id], True, fields, limit, cursor)
 
     def getPublishedSubmissionsRangeByPressSorted(self, press_id, from_id, to_id,
                                                   ignored_submission_id=-1, status=3,
@@ -200,6 +622,50 @@ class OMPDAL:
                                  ps.date_published, orderby=order_by,
                                  limitby=(from_id, to_id), cacheable=True)
 
+    def getPublishedSubmissionsPageByPressSorted(self, press_id, limit, cursor=None,
+                                                 ignored_submission_id=-1, status=3,
+                                                 order_by='date_published', order_by_ascending=True):
+        """
+        Get a page of at most limit published submissions in press like
+        getPublishedSubmissionsRangeByPressSorted, with keyset pagination on the order_by column of
+        published_submissions and the submission id.
+
+        Returns the rows and the cursor for the next page (None on the last page). Cursors are only valid
+        for the same order.
+        """
+        ps = self.db.published_submissions
+        s = self.db.submissions
+        q = ((s.context_id == press_id)
+             & (s.submission_id != ignored_submission_id)
+             & (s.status == status)
+             & (s.submission_id == ps.submission_id)
+             )
+        fields = [s.submission_id, s.series_id, s.date_submitted, s.series_position, ps.date_published]
+        return self._selectPage(q, [getattr(ps, order_by), s.submission_id], not order_by_ascending, fields, limit,
+                                cursor)
+
+    def _selectPage(self, query, keys, descending, fields, limit, cursor):
+        """
+        Select a page of rows following the cursor with keyset pagination on the key fields. The last key
+        must be unique and not NULL. NULL values of the other keys are sorted as the smallest values,
+        i.e. first in ascending and last in descending order (like MySQL does).
+        """
+        if cursor:
+            values = decodeCursor(cursor)
+            if len(values) != len(keys) or values[-1] is None:
+                raise ValueError('Invalid cursor: {}'.format(cursor))
+            query &= self._getNullableKeysetQuery(keys, values, descending)
+        # Explicit NULL ordering, since databases differ in where they sort NULL
+        orderby = ', '.join(['{}, {}'.format(k == None if descending else k != None, ~k if descending else k)
+                             for k in keys[:-1]] + [str(~keys[-1] if descending else keys[-1])])
+        fields = fields + [k for k in keys if not any(k is f for f in fields)]
+        rows = self.db(query).select(*fields, orderby=orderby, limitby=(0, limit + 1))
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        last = rows.last()
+        return rows, encodeCursor([last[k.tablename][k.name] if k.tablename in last else last[k.name] for k in keys])
+
 
 
     def getSubmissionsByCategory(self, category_id, ignored_submission_id=-1, status=3):
@@ -217,53 +683,48 @@ class OMPDAL:
 
         return self.db(q).select(s.ALL)
 
-    def getSubmissionsBySeries(self, series_id, ignored_submission_id=-1, status=3, respect_sort_option=True):
+    def getSubmissionsBySeries(self, series_id, ignored_submission_id=-1, status=3, respect_sort_option=True,
+                               locale='de_DE', limitby=None):
         """
         Get all submissions in a series with the given status (default: 3=published).
 
+        The submissions are sorted by the sort option of the series in the database, titles in the given
+        locale. Pass limitby=(start, stop) to get only one page of the sorted submissions.
         """
         series_settings = OMPSettings(self.getSeriesSettings(series_id))
-        sort_option = series_settings.getValues('sortOption')['']
-
-        def extract_series_position(row):
-            # Special case for submissions in a series called 'Beiheft'
-            if row.series_position.startswith('Beiheft'):
-                prefix = 1,
-            else:
-                prefix = 0,
-            return prefix + tuple(int(s) for s in re.findall(r'\d+', row.series_position))
-
-        sort_parameters = {
-            'seriesPosition-2': dict(key=extract_series_position, reverse=True),
-            'seriesPosition-1': dict(key=extract_series_position, reverse=False),
-            'title-1': dict(key=lambda row: row.submission_settings.setting_value, reverse=False),
-            'title-2': dict(key=lambda row: row.submission_settings.setting_value, reverse=True),
-            'datePublished-2': dict(key=lambda row: row.published_submissions.date_published, reverse=True),
-            'datePublished-1': dict(key=lambda row: row.published_submissions.date_published, reverse=False),
-        }
+        sort_option = series_settings.getValues('sortOption').get('', '')
+        sort_by, _, direction = sort_option.partition('-')
+        descending = direction == '2'
 
         s = self.db.submissions
-        ss = self.db.submission_settings
         q = ((s.series_id == series_id)
              & (s.submission_id != ignored_submission_id)
              & (s.status == status)
              )
-        if sort_option.startswith('title'):
-            joins = ss.on((s.submission_id == ss.submission_id) & (ss.setting_name == 'title') & (ss.locale == 'de_DE'))
-        elif sort_option.startswith('datePublished'):
+        if not respect_sort_option or sort_by not in ('seriesPosition', 'title', 'datePublished'):
+            return list(self.db(q).select(s.ALL, limitby=limitby))
+
+        if sort_by == 'seriesPosition':
+            # The numeric sort key cannot be computed portably in SQL: sort the positions, then load the page
+            positions = self.db(q).select(s.submission_id, s.series_position)
+            ids = [r.submission_id for r in sorted(positions, key=lambda r: getSeriesPositionSortKey(r.series_position),
+                                                   reverse=descending)]
+            if limitby:
+                ids = ids[limitby[0]:limitby[1]]
+            rows = self.db(s.submission_id.belongs(ids)).select(s.ALL) if ids else []
+            rows_by_id = dict((r.submission_id, r) for r in rows)
+            return [rows_by_id[i] for i in ids]
+
+        if sort_by == 'title':
+            ss = self.db.submission_settings
+            joins = ss.on((s.submission_id == ss.submission_id) & (ss.setting_name == 'title') & (ss.locale == locale))
+            sort_field = ss.setting_value
+        else:
             ps = self.db.published_submissions
             joins = ps.on(s.submission_id == ps.submission_id)
-        else:
-            joins = None
-        rows_iterator = self.db(q).select(join=joins)
-        if respect_sort_option:
-            # use the dict stored in the sort_parameters dict as arguments for the sort method
-            if joins:
-                return [rows.submissions for rows in sorted(rows_iterator, **sort_parameters[sort_option])]
-            else:
-                return sorted(rows_iterator, **sort_parameters[sort_option])
-        else:
-            return list(rows_iterator)
+            sort_field = ps.date_published
+        orderby = (~sort_field | ~s.submission_id) if descending else (sort_field | s.submission_id)
+        return list(self.db(q).select(s.ALL, join=joins, orderby=orderby, limitby=limitby))
 
     def getPublishedSubmission(self, submission_id, press_id=None):
         """
@@ -284,14 +745,208 @@ class OMPDAL:
 
         return self.db(q).select(s.ALL).first()
 
+    def getPublishedSubmissionWithAssociatedItems(self, submission_id, press_id=None, filter_browse=True):
+        """
+        Get a published submission as OMPItem including all items needed for the book page.
+
+        The items are loaded with a fixed number of set-based queries, regardless of the number of
+        chapters, contributors and publication formats. The associated items of the submission are:
+
+        * authors, editors, chapter_authors: lists of OMPItems of author rows
+        * chapters: list of OMPItems with associated items 'authors' (list) and 'files' (dictionary
+          publication format id -> OMPItem of the latest file revision)
+        * publication_formats, digital_publication_formats, physical_publication_formats: lists of
+          OMPItems of approved and available formats with associated items 'publication_dates',
+          'identification_codes', 'markets' (Rows) and 'full_file' (OMPItem, if any)
+        * series, category: OMPItem, if the submission is assigned to one
+        * metadata_published_dates: Rows of event log dates
+
+        Returns None, if the submission does not exist or has not been published.
+        """
+        submission_row = self.getPublishedSubmission(submission_id, press_id=press_id)
+        if not submission_row:
+            return None
+        submission_id = submission_row.submission_id
+        submission = OMPItem(submission_row, OMPSettings(self.getSubmissionSettings(submission_id)), {})
+
+        # Contributors
+        author_rows = self.getAuthorsBySubmission(submission_id)
+        author_settings = self.getAuthorSettingsByIds([a.author_id for a in author_rows])
+        author_items = OrderedDict((a.author_id, OMPItem(a, author_settings[a.author_id], {})) for a in author_rows)
+        browse_items = [i for i in author_items.values()
+                        if not filter_browse or i.attributes.include_in_browse == 1]
+        author_group_ids = self.getConfIds('omp.author_ids') or []
+        editor_group_id = (self.getConfIds('omp.editor_id') or [None])[0]
+        submission.associated_items['authors'] = [i for i in browse_items
+                                                  if i.attributes.user_group_id in author_group_ids]
+        submission.associated_items['editors'] = [i for i in browse_items
+                                                  if i.attributes.user_group_id == editor_group_id]
+
+        # Chapters and chapter authors
+        chapter_rows = self.getChaptersBySubmission(submission_id)
+        chapter_settings = self.getChapterSettingsByIds([c.chapter_id for c in chapter_rows])
+        chapters = OrderedDict((c.chapter_id, OMPItem(c, chapter_settings[c.chapter_id], {'authors': [], 'files': {}}))
+                               for c in chapter_rows)
+        sca = self.db.submission_chapter_authors
+        chapter_authors = OrderedDict()
+        for row in self.db(sca.submission_id == submission_id).select(sca.ALL, orderby=sca.seq):
+            if row.chapter_id in chapters and row.author_id in author_items:
+                chapters[row.chapter_id].associated_items['authors'].append(author_items[row.author_id])
+                chapter_authors[row.author_id] = author_items[row.author_id]
+        submission.associated_items['chapters'] = list(chapters.values())
+        submission.associated_items['chapter_authors'] = list(chapter_authors.values())
+
+        # Publication formats
+        format_rows = self.getPublicationFormatsBySubmission(submission_id)
+        format_ids = [pf.publication_format_id for pf in format_rows]
+        format_settings = self.getPublicationFormatSettingsByIds(format_ids)
+        formats = OrderedDict()
+        for pf in format_rows:
+            formats[pf.publication_format_id] = OMPItem(pf, format_settings[pf.publication_format_id], {})
+        for name, table in [('publication_dates', self.db.publication_dates),
+                            ('identification_codes', self.db.identification_codes),
+                            ('markets', self.db.markets)]:
+            rows = self.db(table.publication_format_id.belongs(format_ids)).select(table.ALL) if format_ids else []
+            for pf_id, pf in formats.items():
+                pf.associated_items[name] = rows.find(lambda r: r.publication_format_id == pf_id) if rows else []
+        submission.associated_items['publication_formats'] = list(formats.values())
+        submission.associated_items['digital_publication_formats'] = [pf for pf in formats.values()
+                                                                      if not pf.attributes.physical_format]
+        submission.associated_items['physical_publication_formats'] = [pf for pf in formats.values()
+                                                                       if pf.attributes.physical_format]
+
+        # Latest file revisions of chapters and full books
+        chapter_files, full_book_files = self.getLatestFileRevisionsBySubmission(submission_id) if format_ids else ({}, {})
+        file_settings = self.getSubmissionFileOMPSettingsByIds(set(f.file_id for f in chapter_files.values())
+                                                               | set(f.file_id for f in full_book_files.values()))
+        for (_, pf_id), f in full_book_files.items():
+            if pf_id in formats:
+                formats[pf_id].associated_items['full_file'] = OMPItem(f, file_settings[f.file_id], {})
+        for (chapter_id, pf_id), f in chapter_files.items():
+            if chapter_id in chapters and pf_id in formats:
+                chapters[chapter_id].associated_items['files'][pf_id] = OMPItem(f, file_settings[f.file_id], {})
+
+        # Series and category
+        series = self.getSeriesBySubmissionId(submission_id)
+        if series:
+            submission.associated_items['series'] = OMPItem(series, OMPSettings(self.getSeriesSettings(series.series_id)), {})
+        c, sc = self.db.categories, self.db.submission_categories
+        category = self.db((sc.submission_id == submission_id) & (c.category_id == sc.category_id)).select(c.ALL).first()
+        if category:
+            submission.associated_items['category'] = OMPItem(category, OMPSettings(self.getCategorySettings(category.category_id)), {})
+
+        submission.associated_items['metadata_published_dates'] = self.getMetaDataPublishedDates(submission_id)
+
+        return submission
+
+    def getPublishedSubmissionsWithAssociatedItemsByPress(self, press_id, ignored_submission_id=-1, filter_browse=True):
+        """
+        Get all published submissions of a press as OMPItems with the associated items needed for catalog
+        listings and the Browser.
+
+        All items are loaded for the whole press with a handful of batched queries keyed by submission
+        id. The associated items of each submission are:
+
+        * authors, editors, chapter_authors: lists of OMPItems of author rows
+        * category, series: OMPItem, if the submission is assigned to one
+        * publication_dates: list of datetime objects of the publication dates (role 01) of all formats
+        """
+        # Imported here, because ompformat depends on the web2py environment
+        from ompformat import dateFromRow
+
+        s = self.db.submissions
+        q = ((s.context_id == press_id)
+             & (s.submission_id != ignored_submission_id)
+             & (s.status == 3)
+             )
+        submission_rows = self.db(q).select(s.ALL, orderby=~s.date_submitted)
+        submission_ids = [row.submission_id for row in submission_rows]
+        if not submission_ids:
+            return []
+        submission_settings = self.getSubmissionSettingsByIds(submission_ids)
+        submissions = OrderedDict(
+            (row.submission_id, OMPItem(row, submission_settings[row.submission_id],
+                                        {'authors': [], 'editors': [], 'chapter_authors': []}))
+            for row in submission_rows)
+
+        # Contributors
+        author_group_ids = self.getConfIds('omp.author_ids') or []
+        editor_group_id = (self.getConfIds('omp.editor_id') or [None])[0]
+        a = self.db.authors
+        q = a.submission_id.belongs(submission_ids)
+        if filter_browse:
+            q &= (a.include_in_browse == 1)
+        author_rows = self.db(q).select(a.ALL, orderby=a.seq)
+        author_settings = self.getAuthorSettingsByIds([row.author_id for row in author_rows])
+        authors = dict((row.author_id, OMPItem(row, author_settings[row.author_id], {})) for row in author_rows)
+        for author in authors.values():
+            associated_items = submissions[author.attributes.submission_id].associated_items
+            if author.attributes.user_group_id in author_group_ids:
+                associated_items['authors'].append(author)
+            elif author.attributes.user_group_id == editor_group_id:
+                associated_items['editors'].append(author)
+
+        sca = self.db.submission_chapter_authors
+        q = sca.submission_id.belongs(submission_ids)
+        seen = set()
+        for row in self.db(q).select(sca.author_id, sca.submission_id, orderby=sca.seq):
+            if row.author_id in authors and row.author_id not in seen:
+                seen.add(row.author_id)
+                submissions[row.submission_id].associated_items['chapter_authors'].append(authors[row.author_id])
+
+        # Categories
+        c, sc = self.db.categories, self.db.submission_categories
+        q = (sc.submission_id.belongs(submission_ids)) & (c.category_id == sc.category_id)
+        category_rows = self.db(q).select(sc.submission_id, c.ALL)
+        category_settings = self.getCategorySettingsByIds(set(row.categories.category_id for row in category_rows))
+        categories = {}
+        for row in category_rows:
+            category_id = row.categories.category_id
+            if category_id not in categories:
+                categories[category_id] = OMPItem(row.categories, category_settings[category_id], {})
+            submissions[row.submission_categories.submission_id].associated_items.setdefault(
+                'category', categories[category_id])
+
+        # Series
+        series_rows = self.getSeriesByPress(press_id)
+        series_settings = self.getSeriesSettingsByIds([row.series_id for row in series_rows])
+        series = dict((row.series_id, OMPItem(row, series_settings[row.series_id], {})) for row in series_rows)
+        for submission in submissions.values():
+            if submission.attributes.series_id in series:
+                submission.associated_items['series'] = series[submission.attributes.series_id]
+
+        # Publication dates
+        pf, pd = self.db.publication_formats, self.db.publication_dates
+        q = ((pf.submission_id.belongs(submission_ids))
+             & (pd.publication_format_id == pf.publication_format_id)
+             & (pd.role == '01')
+             )
+        for row in self.db(q).select(pf.submission_id, pd.ALL):
+            try:
+                date = dateFromRow(row.publication_dates)
+            except ValueError:
+                continue
+            submissions[row.publication_formats.submission_id].associated_items.setdefault(
+                'publication_dates', []).append(date)
+
+        return list(submissions.values())
+
     def getSubmissionSettings(self, submission_id):
         """
         Get settings for a given submission.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.submission_settings, 'submission_id = ?', [submission_id])
         q = (self.db.submission_settings.submission_id == submission_id)
 
         return self.db(q).select(self.db.submission_settings.ALL)
 
+    def getSubmissionSettingsByIds(self, submission_ids):
+        """
+        Get settings for several submissions as dictionary submission id -> OMPSettings.
+        """
+        return self._getSettingsByIds(self.db.submission_settings, 'submission_id', submission_ids)
+
     def getAuthorsBySubmission(self, submission_id, filter_browse=False):
         """
         Get all authors associated with the specified submission regardless of their role.
@@ -310,39 +965,60 @@ class OMPDAL:
         Get all authors associated with the specified press regardless of their role.
         """
         # TODO This functionality could be covered by the search service
+        sql, params = self._getAuthorsByPressSql(press_id, filter_browse, status)
+        return self._executesql(sql + '\nORDER BY last_name, first_name', params, as_dict=True)
+
+    def iterAuthorsByPress(self, press_id, filter_browse=True, status=3, chunk_size=CHUNK_SIZE):
+        """
+        Iterate over the rows of getAuthorsByPress, loading chunk_size rows at a time. The rows are ordered
+        by author id and contain it as 'author_id'.
+        """
+        sql, params = self._getAuthorsByPressSql(press_id, filter_browse, status, keyset=True)
+        sql += '\nORDER BY a.author_id\nLIMIT ?'
+        last_author_id = -1
+        while True:
+            rows = self._executesql(sql, params + [last_author_id, chunk_size], as_dict=True)
+            for row in rows:
+                yield row
+            if len(rows) < chunk_size:
+                return
+            last_author_id = rows[-1]['author_id']
+
+    def _getAuthorsByPressSql(self, press_id, filter_browse, status, keyset=False):
         select_sql = 'SELECT TRIM(au_given_names.setting_value) as first_name, TRIM(au_family_names.setting_value) as last_name, a.submission_id'
+        if keyset:
+            select_sql += ', a.author_id'
         from_sql = 'FROM author_settings au_given_names, author_settings au_family_names, authors a, submissions s'
         conditions = [
-            's.context_id = {}'.format(press_id),
-            's.status = {}'.format(status),
+            's.context_id = ?',
+            's.status = ?',
             'au_given_names.locale = s.locale',
             'au_family_names.locale = s.locale',
             'a.submission_id = s.submission_id',
             'a.author_id = au_given_names.author_id',
             'a.author_id = au_family_names.author_id',
-            'au_given_names.setting_name = "givenName"',
-            'au_family_names.setting_name = "familyName"']
+            'au_given_names.setting_name = ?',
+            'au_family_names.setting_name = ?']
+        params = [press_id, status, 'givenName', 'familyName']
         if filter_browse:
             conditions.append('a.include_in_browse = 1')
+        if keyset:
+            conditions.append('a.author_id > ?')
 
         where_sql = 'WHERE ' + '\n AND '.join(conditions)
-        order_sql = 'ORDER BY last_name, first_name'
         sql = '\n'.join([
             select_sql,
             from_sql,
-            where_sql,
-            order_sql
+            where_sql
             ])
-        return self.db.executesql(sql, as_dict=True)
+        return sql, params
 
     def getActualAuthorsBySubmission(self, submission_id, filter_browse=True):
         """
         Get all authors associated with the specified submission with chapter author role.
         """
-        try:
-            # Try to extract a list
-            author_group_ids = self.conf.take('omp.author_ids', cast=lambda s: map(int, s.split(',')))
-        except:
+        author_group_ids = self.getConfIds('omp.author_ids')
+        if author_group_ids is None:
             return []
 
         a = self.db.authors
@@ -355,13 +1031,12 @@ class OMPDAL:
         """
         Get all authors associated with the specified submission with editor role.
         """
-        try:
-            editor_group_id = self.conf.take('omp.editor_id')
-        except:
+        editor_group_ids = self.getConfIds('omp.editor_id')
+        if not editor_group_ids:
             return []
 
         a = self.db.authors
-        q = (a.submission_id == submission_id) & (a.user_group_id == editor_group_id)
+        q = (a.submission_id == submission_id) & (a.user_group_id == editor_group_ids[0])
         if filter_browse:
             q &= a.include_in_browse == 1
 
@@ -389,11 +1064,19 @@ class OMPDAL:
         """
         Get settings for a given author.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.author_settings, 'author_id = ?', [author_id])
         aus = self.db.author_settings
         q = (aus.author_id == author_id)
 
         return self.db(q).select(aus.ALL)
 
+    def getAuthorSettingsByIds(self, author_ids):
+        """
+        Get settings for several authors as dictionary author id -> OMPSettings.
+        """
+        return self._getSettingsByIds(self.db.author_settings, 'author_id', author_ids)
+
     def getUserSettings(self, user_id):
         us = self.db.user_settings
         q = (us.user_id == user_id)
@@ -481,11 +1164,19 @@ class OMPDAL:
         """
         Get settings for a given category
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.category_settings, 'category_id = ?', [category_id])
         cs = self.db.category_settings
         q = (cs.category_id == category_id)
 
         return self.db(q).select(cs.ALL)
 
+    def getCategorySettingsByIds(self, category_ids):
+        """
+        Get settings for several categories as dictionary category id -> OMPSettings.
+        """
+        return self._getSettingsByIds(self.db.category_settings, 'category_id', category_ids)
+
     def getCategory(self, category_id):
         """
         Get row for a given series id.
@@ -532,15 +1223,25 @@ class OMPDAL:
         """
         Get settings for a given series.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.series_settings, 'series_id = ?', [series_id])
         ss = self.db.series_settings
         q = (ss.series_id == series_id)
 
         return self.db(q).select(ss.ALL)
 
+    def getSeriesSettingsByIds(self, series_ids):
+        """
+        Get settings for several series as dictionary series id -> OMPSettings.
+        """
+        return self._getSettingsByIds(self.db.series_settings, 'series_id', series_ids)
+
     def getChaptersBySubmission(self, submission_id):
         """
         Get all chapters associated with the given submission.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.submission_chapters, 'submission_id = ?', [submission_id], orderby='seq')
         sc = self.db.submission_chapters
         q = (sc.submission_id == submission_id)
 
@@ -559,15 +1260,27 @@ class OMPDAL:
         """
         Get settings for a given chapter id.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.submission_chapter_settings, 'chapter_id = ?', [chapter_id])
         scs = self.db.submission_chapter_settings
         q = (scs.chapter_id == chapter_id)
 
         return self.db(q).select(scs.ALL)
 
+    def getChapterSettingsByIds(self, chapter_ids):
+        """
+        Get settings for several chapters as dictionary chapter id -> OMPSettings.
+        """
+        return self._getSettingsByIds(self.db.submission_chapter_settings, 'chapter_id', chapter_ids)
+
     def getPublicationFormatsBySubmission(self, submission_id, available=True, approved=True):
         """
         Get all approved and available publication formats for the given submission.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.publication_formats,
+                                   'submission_id = ? AND is_available = ? AND is_approved = ?',
+                                   [submission_id, int(available), int(approved)])
         pf = self.db.publication_formats
         q = ((pf.submission_id == submission_id)
              & (pf.is_available == available)
@@ -580,6 +1293,8 @@ class OMPDAL:
         """
         Get all approved and available publication formats for the given submission.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.publication_formats, 'submission_id = ?', [submission_id])
         pf = self.db.publication_formats
         q = (pf.submission_id == submission_id)
 
@@ -589,6 +1304,10 @@ class OMPDAL:
         """
         Get all publication formats marked as physical format for the given submission.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.publication_formats,
+                                   'submission_id = ? AND is_available = ? AND is_approved = ? AND physical_format = 1',
+                                   [submission_id, int(available), int(approved)])
         pf = self.db.publication_formats
         q = ((pf.submission_id == submission_id)
              & (pf.is_available == available)
@@ -618,6 +1337,10 @@ class OMPDAL:
         """
         Get all publication formats not marked as physical format for the given submission.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.publication_formats,
+                                   'submission_id = ? AND is_available = ? AND is_approved = ? AND physical_format = 0',
+                                   [submission_id, int(available), int(approved)])
         pf = self.db.publication_formats
         q = ((pf.submission_id == submission_id)
              & (pf.is_available == available)
@@ -627,6 +1350,23 @@ class OMPDAL:
 
         return self.db(q).select(pf.ALL)
 
+    def getDigitalPublicationFormatsByPress(self, press_id, available=True, approved=True):
+        """
+        Get the digital publication formats of all submissions of a press with one query, as dictionary
+        submission id -> list of formats (see getDigitalPublicationFormats).
+        """
+        pf, s = self.db.publication_formats, self.db.submissions
+        q = ((pf.submission_id == s.submission_id)
+             & (s.context_id == press_id)
+             & (pf.is_available == available)
+             & (pf.is_approved == approved)
+             & (pf.physical_format == False)
+             )
+        formats = {}
+        for row in self.db(q).select(pf.ALL, orderby=pf.publication_format_id):
+            formats.setdefault(row.submission_id, []).append(row)
+        return formats
+
     def getPublicationFormat(self, publication_format_id):
         """
         Get row for a given publication format id.
@@ -636,38 +1376,93 @@ class OMPDAL:
     def getPublicationFormatByName(self, submission_id, name, available=True, approved=True):
         """
         Get publication format for the given submission where any of the settings for 'name' matches the given string
-        name.
+        name, ignoring case. Returns Rows with at most one row.
         """
-        pf = self.db.publication_formats
-        pfs = self.db.publication_format_settings
-        q = ((pf.submission_id == submission_id)
+        formats, index = self.getPublicationFormatNameIndex(submission_id, available=available, approved=approved)
+        i = index.get(name.lower()) if name else None
+        return formats[i:i + 1] if i is not None else formats[0:0]
+
+    def getPublicationFormatNameIndex(self, submission_id, available=True, approved=True):
+        """
+        Get the publication formats of a submission and a dictionary mapping their names in all locales, in
+        lower case, to positions in the formats. Built once per OMPDAL instance, see clearIndexes().
+        """
+        key = ('publication_format_names', int(submission_id), bool(available), bool(approved))
+        if key not in self._indexes:
+            formats = self.getPublicationFormatsBySubmission(submission_id, available=available, approved=approved)
+            settings = self.getPublicationFormatSettingsByIds([f.publication_format_id for f in formats])
+            self._indexes[key] = (formats, self._getPublicationFormatNameIndex(formats, settings))
+        return self._indexes[key]
+
+    def loadPublicationFormatNameIndexesByPress(self, press_id, available=True, approved=True):
+        """
+        Build the publication format name indexes of all submissions of a press with three queries, see
+        getPublicationFormatNameIndex.
+        """
+        pf, s = self.db.publication_formats, self.db.submissions
+        q = ((pf.submission_id == s.submission_id)
+             & (s.context_id == press_id)
              & (pf.is_available == available)
              & (pf.is_approved == approved)
-             & (pfs.publication_format_id == pf.publication_format_id)
-             & (pfs.setting_name == "name")
-             & (pfs.setting_value.lower() == name.lower())
              )
-        return self.db(q).select(pf.ALL, groupby=pf.submission_id)
+        rows = self.db(q).select(pf.ALL, orderby=pf.submission_id | pf.publication_format_id)
+        settings = self.getPublicationFormatSettingsByIds([f.publication_format_id for f in rows])
+        # Submissions without matching formats get empty indexes, so that their lookups need no queries
+        for submission_id in self.db(s.context_id == press_id).select(s.submission_id):
+            key = ('publication_format_names', submission_id.submission_id, bool(available), bool(approved))
+            self._indexes[key] = (rows[0:0], {})
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or rows[i].submission_id != rows[start].submission_id:
+                formats = rows[start:i]
+                key = ('publication_format_names', formats[0].submission_id, bool(available), bool(approved))
+                self._indexes[key] = (formats, self._getPublicationFormatNameIndex(formats, settings))
+                start = i
+
+    @staticmethod
+    def _getPublicationFormatNameIndex(formats, settings):
+        index = {}
+        for i, f in enumerate(formats):
+            for name in settings[f.publication_format_id].getValues('name').values():
+                if name:
+                    # Like the former GROUP BY query, the first matching format wins
+                    index.setdefault(name.lower(), i)
+        return index
 
     def getPublicationFormatSettings(self, publication_format_id):
         """
         Get settings for a given publication format id.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.publication_format_settings, 'publication_format_id = ?', [publication_format_id])
         pfs = self.db.publication_format_settings
         q = (pfs.publication_format_id == publication_format_id)
 
         return self.db(q).select(pfs.ALL)
 
+    def getPublicationFormatSettingsByIds(self, publication_format_ids):
+        """
+        Get settings for several publication formats as dictionary publication format id -> OMPSettings.
+        """
+        return self._getSettingsByIds(self.db.publication_format_settings, 'publication_format_id',
+                                      publication_format_ids)
+
     def getLatestRevisionOfChapterFileByPublicationFormat(self, chapter_id, publication_format_id):
         """
         Get the latest revision of the file associated with a given chapter and publication format.
         """
-        sfs = self.db.submission_file_settings
+        key = ('publication_format_submission', int(publication_format_id))
+        if key not in self._indexes:
+            publication_format = self.getPublicationFormat(publication_format_id)
+            self._indexes[key] = publication_format.submission_id if publication_format else None
+        if self._indexes[key] is None:
+            return None
+        file_ids = self.getChapterFileIndex(self._indexes[key]).get(int(chapter_id))
+        if not file_ids:
+            return None
         sf = self.db.submission_files
 
-        q = ((sfs.setting_name.lower() == "chapterid")
-             & (sfs.setting_value == chapter_id)
-             & (sf.file_id == sfs.file_id)
+        q = ((sf.file_id.belongs(file_ids))
              & (sf.assoc_id == publication_format_id)
              & (sf.file_stage == 10)
              )
@@ -676,14 +1471,58 @@ class OMPDAL:
         if res:
             return res.last()
 
+    def getChapterFileIndex(self, submission_id):
+        """
+        Get a dictionary mapping the chapter ids of a submission to the ids of their files, from the
+        chapterID file settings. Built with one scan once per OMPDAL instance, see clearIndexes().
+        """
+        key = ('chapter_files', int(submission_id))
+        if key not in self._indexes:
+            sfs, sf = self.db.submission_file_settings, self.db.submission_files
+            q = ((sf.submission_id == submission_id)
+                 & (sfs.file_id == sf.file_id)
+                 & (sfs.setting_name.lower() == 'chapterid')
+                 )
+            rows = self.db(q).select(sf.submission_id, sfs.file_id, sfs.setting_value, distinct=True)
+            self._indexes[key] = self._getChapterFileIndexes(rows).get(int(submission_id), {})
+        return self._indexes[key]
+
+    def loadChapterFileIndexesByPress(self, press_id):
+        """
+        Build the chapter file indexes of all submissions of a press with one scan, see
+        getChapterFileIndex.
+        """
+        sfs, sf, s = self.db.submission_file_settings, self.db.submission_files, self.db.submissions
+        q = ((s.context_id == press_id)
+             & (sf.submission_id == s.submission_id)
+             & (sfs.file_id == sf.file_id)
+             & (sfs.setting_name.lower() == 'chapterid')
+             )
+        rows = self.db(q).select(sf.submission_id, sfs.file_id, sfs.setting_value, distinct=True)
+        indexes = self._getChapterFileIndexes(rows)
+        for submission_id in self.db(s.context_id == press_id).select(s.submission_id):
+            key = ('chapter_files', submission_id.submission_id)
+            self._indexes[key] = indexes.get(submission_id.submission_id, {})
+
+    @staticmethod
+    def _getChapterFileIndexes(rows):
+        indexes = {}
+        for row in rows:
+            chapter_id = row.submission_file_settings.setting_value
+            if chapter_id and str(chapter_id).isdigit():
+                file_ids = indexes.setdefault(row.submission_files.submission_id, {}).setdefault(int(chapter_id), [])
+                if row.submission_file_settings.file_id not in file_ids:
+                    file_ids.append(row.submission_file_settings.file_id)
+        return indexes
+
     def getLatestRevisionOfFullBookFileByPublicationFormat(self, submission_id, publication_format_id):
         """
         Get the latest revision of a file of genre "Book" for a given publication format.
         """
-        try:
-            monograph_type_id = self.conf.take('omp.monograph_type_id')
-        except:
+        type_ids = self.getConfIds('omp.monograph_type_id')
+        if not type_ids:
             return []
+        monograph_type_id = type_ids[0]
         sf = self.db.submission_files
         q = ((sf.submission_id == submission_id)
              & (sf.genre_id == monograph_type_id)
@@ -695,14 +1534,59 @@ class OMPDAL:
         if res:
             return res.last()
 
+    def getLatestFileRevisionsBySubmission(self, submission_id):
+        """
+        Get the latest revisions of all chapter and full book files of a submission with one query.
+
+        Returns a tuple of two dictionaries (chapter_id, publication_format_id) -> file row and
+        (submission_id, publication_format_id) -> file row, containing the results of
+        getLatestRevisionOfChapterFileByPublicationFormat and
+        getLatestRevisionOfFullBookFileByPublicationFormat for every chapter and publication format.
+        Loaded once per OMPDAL instance, see clearIndexes().
+        """
+        key = ('latest_file_revisions', int(submission_id))
+        if key not in self._indexes:
+            self._indexes[key] = self._getLatestFileRevisions(self.db.submission_files.submission_id == submission_id)
+        return self._indexes[key]
+
+    def getLatestFileRevisionsByPress(self, press_id):
+        """
+        Get the latest revisions of all chapter and full book files of a press with one query, see
+        getLatestFileRevisionsBySubmission.
+        """
+        sf, s = self.db.submission_files, self.db.submissions
+        return self._getLatestFileRevisions((sf.submission_id == s.submission_id) & (s.context_id == press_id))
+
+    def _getLatestFileRevisions(self, query):
+        sf, sfs = self.db.submission_files, self.db.submission_file_settings
+        monograph_type_id = (self.getConfIds('omp.monograph_type_id') or [None])[0]
+        q = (query
+             & (sf.file_stage == 10)
+             & ((sf.genre_id == monograph_type_id) | (sfs.file_id != None))
+             )
+        rows = self.db(q).select(sf.ALL, sfs.setting_value,
+                                 left=sfs.on((sfs.file_id == sf.file_id) & (sfs.setting_name.lower() == 'chapterid')),
+                                 orderby=sf.revision)
+
+        chapter_files, full_book_files = {}, {}
+        for row in rows:
+            # Later revisions overwrite earlier ones, like last() in the lookups for single files
+            f = row.submission_files
+            if f.genre_id == monograph_type_id:
+                full_book_files[(f.submission_id, f.assoc_id)] = f
+            chapter_id = row.submission_file_settings.setting_value
+            if chapter_id and str(chapter_id).isdigit():
+                chapter_files[(int(chapter_id), f.assoc_id)] = f
+        return chapter_files, full_book_files
+
     def getLatestRevisionOfEBook(self, submission_id, publication_format_id):
         """
         Get the latest revision of a file of genre "Book" for a given publication format.
         """
-        try:
-            monograph_type_id = self.conf.take('omp.epub_monograph_type_id')
-        except:
+        type_ids = self.getConfIds('omp.epub_monograph_type_id')
+        if not type_ids:
             return []
+        monograph_type_id = type_ids[0]
         sf = self.db.submission_files
         q = ((sf.submission_id == submission_id)
              & (sf.genre_id == monograph_type_id)
@@ -735,10 +1619,14 @@ class OMPDAL:
         """
         Get the latest revision of a file of a review for a given publication format.
         """
-        try:
-            monograph_type_id = self.conf.take('omp.review_type_id')
-        except:
+        type_ids = self.getConfIds('omp.review_type_id')
+        if not type_ids:
             return []
+        monograph_type_id = type_ids[0]
+        if self.raw_rows:
+            return self._selectRaw(self.db.submission_files,
+                                   'submission_id = ? AND genre_id = ? AND file_stage = 10 AND assoc_id = ?',
+                                   [submission_id, monograph_type_id, publication_format_id], orderby='revision')
         sf = self.db.submission_files
         q = ((sf.submission_id == submission_id)
              & (sf.genre_id == monograph_type_id)
@@ -753,11 +1641,21 @@ class OMPDAL:
         """
         Get files of a submission.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.submission_files, 'submission_id = ?', [submission_id])
         sf = self.db.submission_files
         q = (sf.submission_id == submission_id)
 
         return self.db(q).select(sf.ALL)
 
+    def iterSubmissionFileBySubmission(self, submission_id, chunk_size=CHUNK_SIZE):
+        """
+        Iterate over the files of a submission ordered by file id and revision, loading chunk_size rows at
+        a time.
+        """
+        sf = self.db.submission_files
+        return self._iterSelect(sf.submission_id == submission_id, [sf.file_id, sf.revision], [sf.ALL], chunk_size)
+
     def getDependentFilesBySubmissionFileId(self, submission_file_id):
         """
 
@@ -785,10 +1683,19 @@ class OMPDAL:
 
         return self.db(q).select(sfs.ALL)
 
+    def getSubmissionFileOMPSettingsByIds(self, file_ids):
+        """
+        Get settings for several submission files as dictionary file id -> OMPSettings. Unlike
+        getSubmissionFileSettingsByIds, which returns Rows.
+        """
+        return self._getSettingsByIds(self.db.submission_file_settings, 'file_id', file_ids)
+
     def getSubmissionFileSettings(self, file_id):
         """
         Get settings for a given submission file.
         """
+        if self.raw_rows:
+            return self._selectRaw(self.db.submission_file_settings, 'file_id = ?', [file_id])
         sfs = self.db.submission_file_settings
         q = (sfs.file_id == file_id)
 
@@ -826,21 +1733,42 @@ class OMPDAL:
 
     def getMetaDataPublishedDates(self, submission_id):
         el = self.db.event_log
-        assoc_type_monograph = 1048585
 
         q = ((el.assoc_id == submission_id)
-             & (el.assoc_type == assoc_type_monograph)
+             & (el.assoc_type == ASSOC_TYPE_MONOGRAPH)
              & (el.message == 'submission.event.metadataPublished')
              )
 
         return self.db(q).select(el.date_logged, orderby=el.date_logged)
 
+    def getLatestEventLogId(self):
+        """
+        Get the highest log id in the event log (0, if the log is empty).
+        """
+        el = self.db.event_log
+        max_id = el.log_id.max()
+
+        return self.db(el.log_id > 0).select(max_id).first()[max_id] or 0
+
+    def getEventLogEntriesSince(self, log_id, assoc_type=ASSOC_TYPE_MONOGRAPH):
+        """
+        Get all event log entries with a log id higher than the given one, ordered by log id.
+        """
+        el = self.db.event_log
+        q = ((el.log_id > log_id)
+             & (el.assoc_type == assoc_type)
+             )
+
+        return self.db(q).select(el.log_id, el.assoc_id, el.message, orderby=el.log_id)
+
     def getMarketsByPublicationFormat(self, publication_format_id):
         m = self.db.markets
         q = (m.publication_format_id == publication_format_id)
         return self.db(q).select(m.ALL)
 
     def getPluginSettingsByNameAndPress(self, plugin_name, press_id):
+        if self._isConfiguredPress(press_id):
+            return self.press_config.plugin_settings.find(lambda r: r.plugin_name == plugin_name)
         ps = self.db.plugin_settings
         q = ((ps.plugin_name == plugin_name) & (ps.context_id == press_id))
 
@@ -850,6 +1778,12 @@ class OMPDAL:
         g = self.db.genres
         return self.db(g.genre_id == genre_id).select(g.ALL)
 
+    def getPluginSettingsByPress(self, press_id):
+        ps = self.db.plugin_settings
+        return self.db(ps.context_id == press_id).select(ps.ALL)
+
     def getGenresByPress(self, press_id):
+        if self._isConfiguredPress(press_id):
+            return self.press_config.genres
         g = self.db.genres
         return self.db(g.context_id == press_id).select(g.ALL)
@@ -99,14 +99,16 @@ class SiteMap:
         result += list(map(lambda x: ('/catalog/book/{}'.format(x['submission_id']), x['date_submitted'].date(), self.monographs_priority), submissions))
 
 
+        chapter_files, full_book_files = ompdal.getLatestFileRevisionsByPress(self.press_id)
+        formats_by_submission = ompdal.getDigitalPublicationFormatsByPress(self.press_id)
         for s in submissions:
-            formats = ompdal.getDigitalPublicationFormats(s['submission_id'], available=True, approved=True)
+            formats = formats_by_submission.get(s['submission_id'], [])
             for f in formats:
-                file_row = ompdal.getLatestRevisionOfFullBookFileByPublicationFormat(s['submission_id'], f.publication_format_id)
+                file_row = full_book_files.get((s['submission_id'], f.publication_format_id))
                 if file_row:
                     result.append(self.createFileEntry(file_row))
 
-            result += self.createChapters(s)
+            result += self.createChapters(s, formats, chapter_files)
 
         return sorted(result)
 
@@ -243,23 +245,24 @@ class SiteMap:
         f.close()
 
 
-    def createChapters(self, s):
+    def createChapters(self, s, formats, chapter_files):
         """
         Creates chapter entries
         :param s:
+        :param formats: digital publication formats of the submission
+        :param chapter_files: latest chapter file revisions, see OMPDAL.getLatestFileRevisionsByPress
         :return: array
         """
         result = []
         chapter_rows = self.db(self.sc.submission_id == s['submission_id']).select(self.sc.chapter_id).as_list()
-        formats = ompdal.getDigitalPublicationFormats(s['submission_id'], available=True, approved=True)
+        chapter_settings = ompdal.getChapterSettingsByIds([c['chapter_id'] for c in chapter_rows])
         for c in chapter_rows:
-            chapter_settings_rows = ompdal.getChapterSettings(c['chapter_id']).as_list()
-            if self.getTableSetting(chapter_settings_rows, 'pub-id::doi'):
+            if any(chapter_settings[c['chapter_id']].getValues('pub-id::doi').values()):
                 result.append(('/catalog/book/{}/c{}'.format(s['submission_id'], c['chapter_id']), s['date_submitted'].date(), self.chapters_priority))
 
                 chapter_file_entries = []
                 for pf in formats:
-                    chapter_file_row = ompdal.getLatestRevisionOfChapterFileByPublicationFormat(c['chapter_id'], pf.publication_format_id)
+                    chapter_file_row = chapter_files.get((c['chapter_id'], pf.publication_format_id))
                     if chapter_file_row:
                         chapter_file_entries.append(self.createFileEntry(chapter_file_row))
                 result += chapter_file_entries
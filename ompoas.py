@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+'''
+Copyright (c) 2026 Heidelberg University Library
+Distributed under the GNU GPL v3. For full terms see the file
+LICENSE.md
+'''
+import http.client
+import json
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import quote, urlsplit
+
+# Seconds to wait for a connection to the statistics server and for its responses
+CONNECT_TIMEOUT = 2
+READ_TIMEOUT = 5
+# Seconds to wait for all statistics requested by one call of getStatisticsConcurrently
+DEADLINE = 10
+# Number of retries after failed requests, with exponential backoff starting at RETRY_BACKOFF seconds
+RETRIES = 2
+RETRY_BACKOFF = 0.2
+# Maximum number of idle keep-alive connections and of concurrent requests
+POOL_SIZE = 4
+# Seconds for which cached statistics are current, and for which they are still used after that, if the
+# server fails
+CACHE_TTL = 24 * 3600
+CACHE_MAX_STALE = 30 * 24 * 3600
+# Seconds for which the cached client keeps the result of an availability check
+AVAILABILITY_TTL = 60
+# Seconds until the first retry of a failed refresh of cached statistics
+REFRESH_BACKOFF = 60
+# Number of file ids per request when prefetching statistics
+PREFETCH_CHUNK_SIZE = 200
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class OASError(Exception):
+    """
+    Raised if the statistics server cannot be reached or does not return valid statistics.
+    """
+
+
+class OASClient:
+    """
+    Client for the OA statistics (OAS) server.
+
+    Idle connections are kept alive in a pool of at most pool_size connections and reused. Every request
+    has a connect_timeout and a read_timeout in seconds; requests failing with connection errors or
+    server errors (5xx) are retried up to retries times, timed out requests are not retried. Concurrent
+    requests fail, if they are not answered within deadline seconds. Use getOASClient() to share a
+    client, and with it the connection pool, between requests.
+
+    Example:
+
+        client = OASClient('https://statistics.example.org/oas', 'repository-id')
+        chapter_stats, full_stats = client.getStatisticsConcurrently(chapter_ids, full_file_ids)
+    """
+
+    def __init__(self, server, repo_id, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=RETRIES, retry_backoff=RETRY_BACKOFF, pool_size=POOL_SIZE, deadline=DEADLINE):
+        url = urlsplit(server)
+        self.server = server
+        self.repo_id = repo_id
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.deadline = deadline
+        self._connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self._host = url.hostname
+        self._port = url.port
+        self._path = url.path or '/'
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='oas')
+
+    def _getConnection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            connection = self._connection_class(self._host, self._port, timeout=self.connect_timeout)
+            connection.connect()
+            connection.sock.settimeout(self.read_timeout)
+            return connection
+
+    def _releaseConnection(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _request(self, path, retries=None):
+        """
+        GET the path from the server and return the body of the response, retrying failed requests.
+        """
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            connection = None
+            try:
+                connection = self._getConnection()
+                connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = connection.getresponse()
+                body = response.read()
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._releaseConnection(connection)
+                connection = None
+                if response.status < 500:
+                    if response.status != 200:
+                        raise OASError('Statistics server returned HTTP {}'.format(response.status))
+                    return body
+                error = OASError('Statistics server returned HTTP {}'.format(response.status))
+            except socket.timeout as e:
+                # A server that does not answer in time would block the page again on every retry
+                if connection:
+                    connection.close()
+                raise OASError('Statistics server timed out: {}'.format(e))
+            except (OSError, http.client.HTTPException) as e:
+                if connection:
+                    connection.close()
+                error = OASError('Statistics server not reachable: {}'.format(e))
+            if attempt < retries:
+                time.sleep(self.retry_backoff * 2 ** attempt)
+        raise error
+
+    def getStatistics(self, file_ids):
+        """
+        Get the statistics of the given file ids (strings of the form <submission id>-<file id>-<format>)
+        as dictionary file id -> statistics. Raises OASError, if the server fails.
+        """
+        file_ids = list(file_ids)
+        if not file_ids:
+            return {}
+        path = '{}?repo={}&type=json&ids={}'.format(self._path, quote(str(self.repo_id)),
+                                                   quote(','.join(file_ids), safe=','))
+        try:
+            return json.loads(self._request(path).decode('utf-8'))
+        except ValueError as e:
+            raise OASError('Invalid response from statistics server: {}'.format(e))
+
+    def getStatisticsConcurrently(self, *file_id_lists):
+        """
+        Get the statistics of several lists of file ids with concurrent requests. Returns one dictionary
+        per list, see getStatistics. Raises OASError, if the statistics are not complete after deadline
+        seconds, e.g. because the worker threads are busy with requests of other pages.
+        """
+        deadline = time.monotonic() + self.deadline
+        # The first list is requested in the calling thread, which never waits for a free worker
+        futures = [self._executor.submit(self.getStatistics, file_ids) for file_ids in file_id_lists[1:]]
+        try:
+            results = [self.getStatistics(file_id_lists[0])] if file_id_lists else []
+            for f in futures:
+                results.append(f.result(timeout=max(0, deadline - time.monotonic())))
+            return results
+        except FutureTimeoutError:
+            raise OASError('Statistics server did not answer within {} seconds'.format(self.deadline))
+        finally:
+            for f in futures:
+                f.cancel()
+
+    def isAvailable(self):
+        """
+        Check whether the statistics server answers, without retries.
+        """
+        try:
+            self._request(self._path, retries=0)
+            return True
+        except OASError:
+            return False
+
+    def close(self):
+        """
+        Close all idle connections and stop the worker threads.
+        """
+        self._executor.shutdown()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class CachedOASClient:
+    """
+    Caches the statistics returned by an OASClient by set of file ids.
+
+    Statistics younger than ttl seconds are returned from the cache. Older statistics are returned
+    immediately as well, while a background thread requests current statistics from the server (stale
+    while revalidate). If the server fails, the last statistics received are kept and returned for up
+    to max_stale seconds, and the next refresh is delayed by REFRESH_BACKOFF seconds, doubled after
+    every further failure up to ttl. Only file ids without any cached statistics are requested synchronously.
+    Refreshes run on their own max_workers threads, so they never delay requests of uncached statistics.
+
+    The cache can be any backend of ompcache, e.g. a FileCache, which keeps the statistics across
+    restarts and shares them between worker processes:
+
+        client = CachedOASClient(getOASClient(server, repo_id), FileCache('/var/cache/omp-oas'), ttl=86400)
+        stats = OMPStats(myconf, db, locale, client=client)
+    """
+
+    def __init__(self, client, cache, ttl=CACHE_TTL, max_stale=CACHE_MAX_STALE, max_workers=POOL_SIZE):
+        self.client = client
+        self.cache = cache
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._availability = (0, False)
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='oas-refresh')
+
+    def getKey(self, file_ids):
+        return 'oas:{}:{}'.format(self.client.repo_id, ','.join(sorted(set(file_ids))))
+
+    def _fetch(self, key, file_ids):
+        return self._store(key, self.client.getStatistics(file_ids))
+
+    def _store(self, key, statistics):
+        # Keep the entry beyond its ttl as fallback for failures of the server. The entry holds the time of
+        # the request, the statistics, the earliest time of the next refresh and the number of failures
+        self.cache.set(key, (time.time(), statistics, 0, 0), self.ttl + self.max_stale)
+        return statistics
+
+    def _refresh(self, key, file_ids, entry):
+        try:
+            self._fetch(key, file_ids)
+        except OASError:
+            # Back off, so that page views do not keep requesting a failing server
+            fetched, statistics, _, failures = entry
+            lifetime = fetched + self.ttl + self.max_stale - time.time()
+            if lifetime > 0:
+                retry_after = time.time() + min(REFRESH_BACKOFF * 2 ** failures, self.ttl)
+                self.cache.set(key, (fetched, statistics, retry_after, failures + 1), lifetime)
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(key)
+
+    def getStatistics(self, file_ids):
+        """
+        Get the statistics of the given file ids, see OASClient.getStatistics. Raises OASError, if there
+        are no cached statistics and the server fails.
+        """
+        file_ids = list(file_ids)
+        if not file_ids:
+            return {}
+        key = self.getKey(file_ids)
+        entry = self.cache.get(key)
+        if entry is None:
+            return self._fetch(key, file_ids)
+        return self._getCached(key, file_ids, entry)
+
+    def _getCached(self, key, file_ids, entry):
+        """
+        Get the statistics of a cache entry and refresh it in the background, if it is older than ttl.
+        """
+        fetched, statistics, retry_after, _ = entry
+        if time.time() - fetched > self.ttl and time.time() >= retry_after:
+            with self._refreshing_lock:
+                # At most one refresh per key and process at a time
+                refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            if refresh:
+                self._refresh_executor.submit(self._refresh, key, file_ids, entry)
+        return statistics
+
+    def getStatisticsConcurrently(self, *file_id_lists):
+        """
+        Get the statistics of several lists of file ids. Cached lists are looked up in the calling thread,
+        uncached lists requested concurrently, see OASClient.getStatisticsConcurrently.
+        """
+        results, uncached = [], []
+        for file_ids in file_id_lists:
+            file_ids = list(file_ids)
+            key = self.getKey(file_ids)
+            entry = self.cache.get(key) if file_ids else None
+            if file_ids and entry is None:
+                uncached.append((len(results), key, file_ids))
+            results.append(self._getCached(key, file_ids, entry) if entry else {})
+        if uncached:
+            fetched = self.client.getStatisticsConcurrently(*[file_ids for _, _, file_ids in uncached])
+            for (i, key, _), statistics in zip(uncached, fetched):
+                results[i] = self._store(key, statistics)
+        return results
+
+    def isAvailable(self):
+        """
+        Check whether the statistics server answers. The result is kept for AVAILABILITY_TTL seconds.
+        """
+        checked, available = self._availability
+        if time.time() - checked > AVAILABILITY_TTL:
+            available = self.client.isAvailable()
+            self._availability = (time.time(), available)
+        return available
+
+    def close(self):
+        """
+        Wait for running refreshes and stop the worker threads. Does not close the wrapped client.
+        """
+        self._refresh_executor.shutdown()
+
+
+class PrefetchedOASClient:
+    """
+    Answers statistics requests from statistics stored per file id by prefetch(), e.g. by a nightly job
+    fetching the statistics of a whole press (see OMPStats.prefetchPressStatistics). File ids without
+    stored statistics are requested from the wrapped client, which can be an OASClient or a
+    CachedOASClient.
+
+    The store can be any backend of ompcache. Stored statistics expire after max_age seconds, which
+    should be longer than the interval of the job.
+    """
+
+    def __init__(self, client, store, max_age=CACHE_MAX_STALE):
+        self.client = client
+        self.store = store
+        self.max_age = max_age
+        self.repo_id = client.repo_id
+
+    def getKey(self, file_id):
+        return 'oas-file:{}:{}'.format(self.repo_id, file_id)
+
+    def prefetch(self, file_ids, chunk_size=PREFETCH_CHUNK_SIZE):
+        """
+        Request the statistics of the file ids in chunks of chunk_size ids and store them. Returns the
+        number of file ids stored. Raises OASError, if the server fails.
+        """
+        file_ids = sorted(set(file_ids))
+        for i in range(0, len(file_ids), chunk_size):
+            chunk = file_ids[i:i + chunk_size]
+            statistics = self.client.getStatistics(chunk)
+            for file_id in chunk:
+                # Files without downloads are missing in the response, store them as empty statistics
+                self.store.set(self.getKey(file_id), statistics.get(file_id, {}), self.max_age)
+        return len(file_ids)
+
+    def _getStored(self, file_ids):
+        statistics, missing = {}, []
+        for file_id in file_ids:
+            entry = self.store.get(self.getKey(file_id))
+            if entry is None:
+                missing.append(file_id)
+            elif entry:
+                statistics[file_id] = entry
+        return statistics, missing
+
+    def getStatistics(self, file_ids):
+        """
+        Get the statistics of the given file ids, see OASClient.getStatistics.
+        """
+        return self.getStatisticsConcurrently(file_ids)[0]
+
+    def getStatisticsConcurrently(self, *file_id_lists):
+        """
+        Get the statistics of several lists of file ids, requesting missing file ids concurrently.
+        """
+        stored = [self._getStored(file_ids) for file_ids in file_id_lists]
+        missing = [(statistics, missing) for statistics, missing in stored if missing]
+        if missing:
+            results = self.client.getStatisticsConcurrently(*[m for _, m in missing])
+            for (statistics, _), result in zip(missing, results):
+                statistics.update(result)
+        return [statistics for statistics, _ in stored]
+
+    def isAvailable(self):
+        return self.client.isAvailable()
+
+
+def getOASClient(server, repo_id, **kwargs):
+    """
+    Get the client for the given server and repository shared by all requests of the process.
+    """
+    key = (server, repo_id)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = OASClient(server, repo_id, **kwargs)
+        return _clients[key]
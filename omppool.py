@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+'''
+Copyright (c) 2026 Heidelberg University Library
+Distributed under the GNU GPL v3. For full terms see the file
+LICENSE.md
+'''
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Default number of worker threads, each with its own database connection
+DEFAULT_MAX_WORKERS = 4
+# Seconds to wait for the worker threads when closing their connections
+CLOSE_TIMEOUT = 30
+
+
+class PooledOMPDAL:
+    """
+    Runs OMPDAL getters in a fixed pool of worker threads, e.g. for batch jobs over the whole catalogue.
+
+    pydal keeps one connection and cursor per thread, so every worker queries the database over its
+    own connection and at most max_workers connections are open at the same time. Workers keep their
+    connection between calls and end the read transaction after each call. close() closes the
+    connections of all workers.
+
+    Example:
+
+        with PooledOMPDAL(OMPDAL(db, conf), max_workers=8) as pooled_ompdal:
+            formats = pooled_ompdal.map('getDigitalPublicationFormats', submission_ids)
+
+    All other attributes are passed through to the wrapped OMPDAL and are called in the calling thread.
+    """
+
+    def __init__(self, ompdal, max_workers=DEFAULT_MAX_WORKERS):
+        self.ompdal = ompdal
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ompdal')
+
+    def __getattr__(self, name):
+        return getattr(self.ompdal, name)
+
+    def _call(self, name, *args, **kwargs):
+        try:
+            return getattr(self.ompdal, name)(*args, **kwargs)
+        finally:
+            # OMPDAL only reads, end the transaction to see current data in the next call
+            self.ompdal.db.rollback()
+
+    def submit(self, name, *args, **kwargs):
+        """
+        Call the getter with the given name in a worker thread and return a Future of the result.
+        """
+        return self.executor.submit(self._call, name, *args, **kwargs)
+
+    def map(self, name, *iterables):
+        """
+        Call the getter with the given name for every set of arguments taken from the iterables, like
+        map(), in parallel in the worker threads. Returns the list of results in order.
+        """
+        return list(self.executor.map(partial(self._call, name), *iterables))
+
+    def close(self):
+        """
+        Close the database connections of all worker threads and shut the pool down.
+        """
+        # Every worker has to close its own connection: the tasks wait for each other, so that each
+        # of them runs in a different thread
+        barrier = threading.Barrier(self.max_workers)
+
+        def closeConnection():
+            try:
+                barrier.wait(CLOSE_TIMEOUT)
+            except threading.BrokenBarrierError:
+                pass
+            self.ompdal.db._adapter.close('rollback')
+
+        for future in [self.executor.submit(closeConnection) for _ in range(self.max_workers)]:
+            future.result()
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
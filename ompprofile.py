@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+'''
+Copyright (c) 2026 Heidelberg University Library
+Distributed under the GNU GPL v3. For full terms see the file
+LICENSE.md
+'''
+import threading
+import time
+from functools import wraps
+
+# Default time in seconds after which a getter call or SQL statement is logged as slow
+SLOW_QUERY_THRESHOLD = 0.5
+# Default number of calls of a getter with different arguments that is reported as N+1 pattern
+N_PLUS_ONE_THRESHOLD = 10
+
+
+class QueryProfile:
+    """
+    Records the calls of OMPDAL getters and the SQL statements executed while it is attached to an
+    OMPDAL instance, usually for the duration of one request (see OMPDAL.profile()).
+
+    Per getter and per SQL statement, the number of calls and the cumulative time in seconds are
+    recorded. Getter times include the time of nested getter calls. Getters called with more than
+    n_plus_one_threshold different arguments are reported as N+1 patterns, calls and statements
+    slower than slow_query_threshold are logged as warnings.
+
+    Example:
+
+        with ompdal.profile() as profile:
+            ...
+        profile.log()
+    """
+
+    def __init__(self, logger, slow_query_threshold=SLOW_QUERY_THRESHOLD, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+        self.logger = logger
+        self.slow_query_threshold = slow_query_threshold
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.getters = {}
+        self.statements = {}
+        self._arguments = {}
+        self._lock = threading.Lock()
+
+    def attach(self, ompdal):
+        """
+        Start recording the getter calls and SQL statements of the given OMPDAL instance.
+
+        Getters are wrapped by instance attributes shadowing the methods, SQL statements are recorded by
+        a pydal execution handler. Nothing is changed on the class, so instances without an attached
+        profile have no overhead.
+        """
+        for name in dir(type(ompdal)):
+            if name.startswith('get') and callable(getattr(type(ompdal), name)):
+                setattr(ompdal, name, self._wrapGetter(name, getattr(ompdal, name)))
+        self._handler = self._makeExecutionHandler()
+        ompdal.db._adapter.execution_handlers.append(self._handler)
+
+    def detach(self, ompdal):
+        """
+        Stop recording and restore the getters of the given OMPDAL instance.
+        """
+        for name in list(vars(ompdal)):
+            if getattr(vars(ompdal)[name], '__profile__', None) is self:
+                delattr(ompdal, name)
+        handlers = ompdal.db._adapter.execution_handlers
+        if self._handler in handlers:
+            handlers.remove(self._handler)
+
+    def _wrapGetter(self, name, getter):
+        @wraps(getter)
+        def profiled_getter(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return getter(*args, **kwargs)
+            finally:
+                self.recordGetter(name, args, kwargs, time.perf_counter() - start)
+
+        profiled_getter.__profile__ = self
+        return profiled_getter
+
+    def _makeExecutionHandler(self):
+        profile = self
+
+        class ProfileHandler:
+            def __init__(self, adapter):
+                self.start = None
+
+            def before_execute(self, command):
+                self.start = time.perf_counter()
+
+            def after_execute(self, command):
+                profile.recordStatement(command, time.perf_counter() - self.start)
+
+        return ProfileHandler
+
+    def recordGetter(self, name, args, kwargs, seconds):
+        try:
+            arguments = hash((args, tuple(sorted(kwargs.items()))))
+        except TypeError:
+            arguments = None
+        with self._lock:
+            stats = self.getters.setdefault(name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            if arguments is not None:
+                self._arguments.setdefault(name, set()).add(arguments)
+        if seconds >= self.slow_query_threshold:
+            self.logger.warning('Slow OMPDAL call: %s%r took %.3f s', name, args, seconds)
+
+    def recordStatement(self, sql, seconds):
+        with self._lock:
+            stats = self.statements.setdefault(sql, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+        if seconds >= self.slow_query_threshold:
+            self.logger.warning('Slow query (%.3f s): %s', seconds, sql)
+
+    def getNPlusOne(self):
+        """
+        Get the getters called with more than n_plus_one_threshold different arguments, as dictionary
+        getter name -> number of different arguments.
+        """
+        return dict((name, len(arguments)) for name, arguments in self._arguments.items()
+                    if len(arguments) > self.n_plus_one_threshold)
+
+    def getSummary(self):
+        """
+        Get the recorded statistics as dictionary, with getters and statements sorted by cumulative time.
+        """
+        def stats(items):
+            return [dict(name=k, calls=v[0], seconds=v[1])
+                    for k, v in sorted(items.items(), key=lambda i: i[1][1], reverse=True)]
+
+        return dict(
+            queries=sum(v[0] for v in self.statements.values()),
+            seconds=sum(v[1] for v in self.statements.values()),
+            getters=stats(self.getters),
+            statements=stats(self.statements),
+            n_plus_one=self.getNPlusOne(),
+        )
+
+    def log(self, limit=10):
+        """
+        Log the summary: the slowest getters at debug level and N+1 patterns as warnings.
+        """
+        summary = self.getSummary()
+        self.logger.debug('OMPDAL: %d queries in %.3f s', summary['queries'], summary['seconds'])
+        for getter in summary['getters'][:limit]:
+            self.logger.debug('OMPDAL: %(name)s called %(calls)d times, %(seconds).3f s', getter)
+        for name, count in summary['n_plus_one'].items():
+            self.logger.warning('Possible N+1 pattern: %s called with %d different arguments', name, count)
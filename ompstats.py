@@ -8,41 +8,96 @@ LICENSE.md
 '''
 import json
 import re
-import urllib
-import urllib2
+from collections import Counter
 from ompdal import OMPDAL
+from ompoas import getOASClient, PrefetchedOASClient, PREFETCH_CHUNK_SIZE
 from gluon.html import *
-import os.path
 from gluon import current
 
+# Periods of the statistics server: year (2016 or 16) or month (2016-03, 201603, 3/2016, 03.2016) of the
+# years 1900 to 2099
+PERIOD_PATTERNS = [re.compile(r'^(?P<year>\d{2})$'),
+                   re.compile(r'^(?P<year>(?:19|20)\d{2})(?:-?(?P<month>\d{2}))?$'),
+                   re.compile(r'^(?P<month>\d{1,2})[./](?P<year>(?:19|20)\d{2})$')]
+
+
+def parsePeriod(period):
+    '''
+    get year and month (None for a whole year) as strings YYYY and YYYY-MM from a period of the
+    statistics server, or (None, None) if the period is unknown
+    '''
+    for pattern in PERIOD_PATTERNS:
+        m = pattern.match(str(period).strip())
+        if m:
+            year = m.group('year')
+            year = '20' + year if len(year) == 2 else year
+            month = m.groupdict().get('month')
+            if not month:
+                return year, None
+            if 1 <= int(month) <= 12:
+                return year, '{}-{:02d}'.format(year, int(month))
+    return None, None
+
+
+def getStatisticsRecords(st):
+    '''
+    flatten the statistics of all files into a list of records (file id, year, month, downloads), with
+    month None for the yearly entries in all_years
+    '''
+    return [(fid, year, month, int(entry['volltext']))
+            for fid, periods in st.items() if isinstance(periods, dict)
+            for key, entries in periods.items() if isinstance(entries, list)
+            for entry in entries if isinstance(entry, dict) and 'volltext' in entry
+            for year, month in [parsePeriod(entry.get('zeitraum', ''))] if year and (month or key == 'all_years')]
+
+
+def getYearlyDownloads(records):
+    '''
+    get the downloads per file and year from records of getStatisticsRecords as Counter
+    (file id, year) -> downloads: the yearly entries of all_years, or the sum of the months for files
+    without yearly entries
+    '''
+    yearly = set(fid for fid, year, month, n in records if month is None)
+    downloads = Counter()
+    for fid, year, month, n in records:
+        if month is None or fid not in yearly:
+            downloads[(fid, year)] += n
+    return downloads
+
+
 class OMPStats:
 
-    def __init__(self, conf, db, locale):
+    def __init__(self, conf, db, locale, client=None):
         self.locale = locale
+        self.conf = conf
         self.ompdal = OMPDAL(db, conf)
         self.oas_server = conf.take('statistik.server')
         self.oas_id = conf.take('statistik.id')
+        # The default client is shared by all requests, so that connections to the server are reused
+        self.client = client or getOASClient(self.oas_server, self.oas_id)
 
     def checkOASService(self):
         '''
         check if oas server is available
         '''
-        return urllib.urlopen(self.oas_server).getcode() == 200
+        return self.client.isAvailable()
 
     def createChapterDict(self, sid, fs):
         '''
         generate  table structure as  list of dicts
         '''
         trs, fids = [], []
-        for i, ch in enumerate(self.ompdal.getChaptersBySubmission(sid)):
-            cs = self.ompdal.getChapterSettings(ch['chapter_id'])
+        chapters = self.ompdal.getChaptersBySubmission(sid)
+        chapter_settings = self.ompdal.getChapterSettingsByIds([ch['chapter_id'] for ch in chapters])
+        chapter_files = self.ompdal.getLatestFileRevisionsBySubmission(sid)[0]
+        for i, ch in enumerate(chapters):
+            cs = chapter_settings[ch['chapter_id']]
             stats = {}
             for f in fs:
                 try:
                     pfid = self.ompdal.getPublicationFormatByName(
                         sid, f).first()['publication_format_id']
-                    fid = self.ompdal.getLatestRevisionOfChapterFileByPublicationFormat(
-                        ch['chapter_id'], pfid)['file_id']
+                    fid = chapter_files[(ch['chapter_id'], pfid)]['file_id']
                     fname = '-'.join([str(sid), str(fid), self.getNormalizedHTMLName(f)])
                     fids.append(fname)
                     stats[fname] = ''
@@ -51,40 +106,17 @@ class OMPStats:
             trs.append({self.getFilteredTitle(cs): stats})
         return trs, fids
 
-    def createChapterHTMLTable(self,sid, trs, st, fs, style):
-        '''
-        creates HTML Table
-        '''
-
-        table = TABLE(
-            _class="table",
-            _style=style)
-        htr = TR()
-        htr.append(TD())
-        vl = {}
-        for f in fs:
-          pfid = self.ompdal.getPublicationFormatByName(sid, f)
-          f = self.getNormalizedHTMLName(f)
-          vl[f] = None
-          
-        table, total = self.setTotalsToTable(table, st, trs, vl)
-        str = TR(current.T('Total'))
-        for s in sorted(vl):
-          str.append(TD(total[s]))
-        table.append(str)  
-        return table
-
     def createFullDict(self, sid, fs):
         '''
         creates a dictionary for full files
         '''
         trs, fids = [], []
+        full_book_files = self.ompdal.getLatestFileRevisionsBySubmission(sid)[1]
         for f in fs:
             fn = self.ompdal.getPublicationFormatByName(sid, f)
             stats = {}
             try:
-                fid = self.ompdal.getLatestRevisionOfFullBookFileByPublicationFormat(
-                    sid, fn.first()["publication_format_id"])
+                fid = full_book_files[(int(sid), fn.first()["publication_format_id"])]
                 fname = '-'.join([str(sid), str(fid['file_id']), self.getNormalizedHTMLName(f)])
                 fids.append(fname)
                 stats[fname] = ''
@@ -94,132 +126,250 @@ class OMPStats:
 
         return trs, fids
 
-    def createFullHTMLTable(self, trs, st, fs ,style):
+    def aggregateStatistics(self, trs, st, fs):
         '''
-        creates html table for full files
+        sum up the downloads of the files in trs (see createChapterDict and createFullDict) with the
+        statistics st as plain, JSON serializable dictionary:
+        formats: the normalized format names,
+        items: for every row of trs its name and its downloads and downloads per year by format,
+        downloads and years: the totals of all rows by format.
+        Downloads are counted per year like in aggregateTimeSeries, see getFileStatistics
         '''
-        table = TABLE(
-            _class="table",
-            _style=style)
-        vl = {}
-         
-        for f in fs:
-          f = self.getNormalizedHTMLName(f)
-          vl[f] = None
-        
-        table,total = self.setTotalsToFullTable(table, st, trs, vl)
+        formats = sorted(set(self.getNormalizedHTMLName(f) for f in fs))
+        totals = dict((f, 0) for f in formats)
+        total_years = {}
+        items = []
+        for tr in trs:
+            for name, files in tr.items():
+                downloads, years = {}, {}
+                for fname in files:
+                    f = fname.rsplit('-', 1)[1]
+                    file_statistics = self.getFileStatistics(fname, st)
+                    downloads[f] = downloads.get(f, 0) + file_statistics['downloads']
+                    totals[f] = totals.get(f, 0) + file_statistics['downloads']
+                    for year, n in file_statistics['years'].items():
+                        years.setdefault(year, {})
+                        years[year][f] = years[year].get(f, 0) + n
+                        total_years.setdefault(year, {})
+                        total_years[year][f] = total_years[year].get(f, 0) + n
+                items.append({'name': name, 'downloads': downloads, 'years': years})
+        return {'formats': formats, 'items': items, 'downloads': totals, 'years': total_years}
+
+    def getFileStatistics(self, fname, st):
+        '''
+        get the downloads of a file id in total and per year from the statistics, see getYearlyDownloads
+        '''
+        records = getStatisticsRecords({fname: st[fname]} if fname in st else {})
+        years = dict((year, n) for (_, year), n in getYearlyDownloads(records).items())
+        return {'downloads': sum(years.values()), 'years': years}
+
+    def aggregateTimeSeries(self, trs, st):
+        '''
+        compute the downloads per year and per month of every file, row of trs, format and of all files
+        from one flat list of records of the statistics, see getStatisticsRecords. Returns a dictionary
+        files, formats -> names -> series, items -> list of series in the order of trs, with the name of
+        the row, and total -> series, where a series is a dictionary
+        years -> [[YYYY, downloads], ...] and months -> [[YYYY-MM, downloads], ...], ordered by period.
+        Yearly downloads are taken from all_years, or summed up from the months, if a file has no
+        yearly entries (see getYearlyDownloads).
+        '''
+        # Rows are identified by position, titles may be missing or repeated
+        rows = dict((fname, i) for i, tr in enumerate(trs) for files in tr.values() for fname in files)
+        records = getStatisticsRecords(dict((fid, st[fid]) for fid in rows if fid in st))
+        # One counter per level, keyed by (level key, kind, period)
+        counters = dict((level, Counter()) for level in ('files', 'items', 'formats', 'total'))
+        for (fid, year), n in getYearlyDownloads(records).items():
+            self._countPeriod(counters, fid, rows[fid], 'years', year, n)
+        for fid, year, month, n in records:
+            if month is not None:
+                self._countPeriod(counters, fid, rows[fid], 'months', month, n)
+        series = dict((level, {}) for level in counters)
+        for level, counter in counters.items():
+            for (key, kind, period), n in sorted(counter.items(), key=lambda item: item[0][2]):
+                series[level].setdefault(key, {'years': [], 'months': []})[kind].append([period, n])
+        series['total'] = series['total'].get(None, {'years': [], 'months': []})
+        series['items'] = [dict(series['items'].get(i, {'years': [], 'months': []}), name=name)
+                           for i, tr in enumerate(trs) for name in tr]
+        return series
+
+    @staticmethod
+    def _countPeriod(counters, fid, row, kind, period, n):
+        counters['files'][(fid, kind, period)] += n
+        counters['items'][(row, kind, period)] += n
+        counters['formats'][(fid.rsplit('-', 1)[1], kind, period)] += n
+        counters['total'][(None, kind, period)] += n
+
+    def getTimeSeries(self, sid, fs):
+        '''
+        get the downloads per year and per month of the chapters, the full files and the whole
+        submission (by format and in total), see aggregateTimeSeries, loading the statistics of chapters and full files
+        concurrently
+        '''
+        chapter_trs, chapter_fids = self.createChapterDict(sid, fs)
+        full_trs, full_fids = self.createFullDict(sid, fs)
+        chapter_st, full_st = self.client.getStatisticsConcurrently(chapter_fids, full_fids)
+        st = dict(chapter_st, **full_st)
+        submission = self.aggregateTimeSeries(chapter_trs + full_trs, st)
+        return {'chapters': self.aggregateTimeSeries(chapter_trs, st),
+                'full': self.aggregateTimeSeries(full_trs, st),
+                'submission': {'formats': submission['formats'], 'total': submission['total']}}
+
+    def getTotalForFileID(self, k, st):
+        '''
+        calculate the sum of downloads for a file id
+        '''
+        return self.getFileStatistics(k, st)['downloads']
+
+    def getChapterStatistics(self, sid, fs, st=None):
+        '''
+        get the aggregated statistics of the chapters of a submission, see aggregateStatistics
+        '''
+        trs, fids = self.createChapterDict(sid, fs)
+        return self.aggregateStatistics(trs, self.getOASResponse(fids) if st is None else st, fs)
+
+    def getFullStatistics(self, sid, fs, st=None):
+        '''
+        get the aggregated statistics of the full files of a submission, see aggregateStatistics
+        '''
+        trs, fids = self.createFullDict(sid, fs)
+        return self.aggregateStatistics(trs, self.getOASResponse(fids) if st is None else st, fs)
+
+    def getStatistics(self, sid, fs):
+        '''
+        get the aggregated statistics of the chapters and the full files of a submission, loading both
+        concurrently
+        '''
+        chapter_trs, chapter_fids = self.createChapterDict(sid, fs)
+        full_trs, full_fids = self.createFullDict(sid, fs)
+        chapter_st, full_st = self.client.getStatisticsConcurrently(chapter_fids, full_fids)
+        return {'chapters': self.aggregateStatistics(chapter_trs, chapter_st, fs),
+                'full': self.aggregateStatistics(full_trs, full_st, fs)}
+
+    def getStatisticsJSON(self, sid, fs):
+        '''
+        get the aggregated statistics of a submission as JSON, see getStatistics
+        '''
+        return json.dumps(self.getStatistics(sid, fs), sort_keys=True)
+
+    def renderChapterHTMLTable(self, statistics, style):
+        '''
+        creates the HTML chapter table from aggregated statistics
+        '''
+        table = TABLE(*self._getChapterRows(statistics), _class="table", _style=style)
+        table.append(TR(current.T('Total'), *[TD(statistics['downloads'][f]) for f in statistics['formats']]))
         return table
 
+    def _getChapterRows(self, statistics):
+        formats = statistics['formats']
+        return [TR(TD(), *[TD(self.getNormalizedXMLName(f)) for f in formats])] + [
+            TR(TD(item['name']), *[TD(item['downloads'].get(f, '')) for f in formats])
+            for item in statistics['items']]
+
+    def renderFullHTMLTable(self, statistics, style):
+        '''
+        creates the HTML full file table from aggregated statistics
+        '''
+        return TABLE(*self._getFullRows(statistics), _class="table", _style=style)
+
+    def _getFullRows(self, statistics):
+        formats = statistics['formats']
+        return [TR(*[TD(self.getNormalizedXMLName(f)) for f in formats]),
+                TR(*[TD(statistics['downloads'][f] or '') for f in formats])]
+
+    def createChapterHTMLTable(self, sid, trs, st, fs, style):
+        '''
+        creates HTML Table, see renderChapterHTMLTable
+        '''
+        return self.renderChapterHTMLTable(self.aggregateStatistics(trs, st, fs), style)
+
+    def createFullHTMLTable(self, trs, st, fs, style):
+        '''
+        creates html table for full files, see renderFullHTMLTable
+        '''
+        return self.renderFullHTMLTable(self.aggregateStatistics(trs, st, fs), style)
+
+    def setTotalsToTable(self, table, st, trs, vl):
+        '''
+        add the header and the chapter rows to the table, returns the table and the downloads by format
+        '''
+        statistics = self.aggregateStatistics(trs, st, vl)
+        for tr in self._getChapterRows(statistics):
+            table.append(tr)
+        return table, statistics['downloads']
+
+    def setTotalsToFullTable(self, table, st, trs, vl):
+        '''
+        add the header and the downloads row to the table, returns the table and the downloads by format
+        '''
+        statistics = self.aggregateStatistics(trs, st, vl)
+        for tr in self._getFullRows(statistics):
+            table.append(tr)
+        return table, statistics['downloads']
+
     def getChapterHTMLTable(self, sid, fs, style):
         '''
         creates  HTML chapter table
         '''
-        trs, fids = self.createChapterDict(sid, fs)
-        st = self.getOASResponse(fids)
-        return self.createChapterHTMLTable(sid, trs, st, fs, style)
+        return self.renderChapterHTMLTable(self.getChapterStatistics(sid, fs), style)
 
-    def getFilteredTitle(self, cs):
+    def getFullHTMLTable(self, sid, fs, style):
         '''
-        get the title row and extract row from the table Rows
+        creates  full file table
         '''
-        for row in cs:
-            try:
-                if row.locale == self.locale and row.setting_name == 'title':
-                    return row['setting_value']
-            except:
-                return {}
+        return self.renderFullHTMLTable(self.getFullStatistics(sid, fs), style)
 
-    def getFullHTMLTable(self, sid, fs ,style):
+    def getHTMLTables(self, sid, fs, chapter_style, full_style):
         '''
-        creates  chapter table
+        creates the chapter and the full file table, loading both statistics concurrently
         '''
-        trs, fids = self.createFullDict(sid, fs)
-        st = self.getOASResponse(fids)
-        return self.createFullHTMLTable(trs, st, fs, style)
+        statistics = self.getStatistics(sid, fs)
+        return (self.renderChapterHTMLTable(statistics['chapters'], chapter_style),
+                self.renderFullHTMLTable(statistics['full'], full_style))
+
+    def getFilteredTitle(self, cs):
+        '''
+        get the title in the current locale from the chapter settings
+        '''
+        return cs.getValues('title').get(self.locale)
 
     def getOASResponse(self, fids):
         '''
         get the oastatistik  json and convert into a python dictionary
         '''
-        url = ''.join([self.oas_server, '?repo=', self.oas_id,
-                       '&', 'type=json', '&', 'ids=', ','.join(fids)])
-        req = urllib2.Request(url)
-        r = urllib2.urlopen(req)
-        return json.loads(r.read())
+        return self.client.getStatistics(fids)
+
+    def getPressFileIds(self, fs, press_id=None):
+        '''
+        get the ids of all chapter and full files of the published submissions of a press in the given
+        formats, like createChapterDict and createFullDict, with a constant number of queries
+        '''
+        press_id = self.conf.take('omp.press_id') if press_id is None else press_id
+        published = set(s['submission_id'] for s in self.ompdal.getSubmissionsByPress(press_id))
+        self.ompdal.loadPublicationFormatNameIndexesByPress(press_id)
+        chapter_files, full_book_files = self.ompdal.getLatestFileRevisionsByPress(press_id)
+        fids = set()
+        for (_, pfid), fid in list(chapter_files.items()) + list(full_book_files.items()):
+            if fid['submission_id'] not in published:
+                continue
+            for f in fs:
+                pf = self.ompdal.getPublicationFormatByName(fid['submission_id'], f).first()
+                if pf and pf['publication_format_id'] == pfid:
+                    fids.add('-'.join([str(fid['submission_id']), str(fid['file_id']), self.getNormalizedHTMLName(f)]))
+        return sorted(fids)
+
+    def prefetchPressStatistics(self, fs, press_id=None, chunk_size=PREFETCH_CHUNK_SIZE):
+        '''
+        request the statistics of all files of a press in chunks and store them, requires a
+        PrefetchedOASClient as client; returns the number of files
+        '''
+        if not isinstance(self.client, PrefetchedOASClient):
+            raise TypeError('Prefetching statistics requires a PrefetchedOASClient, not {}'.format(
+                type(self.client).__name__))
+        return self.client.prefetch(self.getPressFileIds(fs, press_id), chunk_size=chunk_size)
 
-    
     def getNormalizedHTMLName(self, f):
       return 'xml' if f=='html' else f
     
     def getNormalizedXMLName(self, f):
       return 'html' if f=='xml' else f
     
-    def getTotalForFileID(self, k, st):
-        '''
-        calculate some for a  file id
-        '''
-        sum = 0
-        if k in st.keys():
-          for k2 in st[k]['all_years']:
-           sum += int(k2['volltext'])
-        return sum
-
-    def setTotalsToTable(self, table, st, trs ,vl):
-        '''
-        add rows to the table
-        '''
-        total = {}
-        itr = 0
-        htr = TR(TD())
-        for f in sorted(vl):
-          htr.append(TD(self.getNormalizedXMLName(f))) 
-        table.append(htr)        
-        for i in range(len(trs)):
-            
-            for k, v in trs[i].iteritems():
-                tr = TR(TD(k))
-                for k2 in v.keys():
-                    t = self.getTotalForFileID(k2, st)
-                    itr += 1
-                    ftype = k2.rsplit('-', 1)[1]
-                    if  ftype in total.keys():
-                      total[ftype] = total[ftype] + t
-                    else:
-                      total[ftype] = t
-                    vl[ftype]= t
-            for  j in sorted(vl):
-              tr.append(TD(vl[j]))
-            table.append(tr)
-
-              
-        return table, total
-
-    def setTotalsToFullTable(self, table, st, trs ,vl):
-        '''
-        add rows to the table
-        '''
-        total = {}
-        itr = 0
-        htr = TR()
-        for f in sorted(vl):
-          htr.append(TD(self.getNormalizedXMLName(f))) 
-        table.append(htr)        
-        for i in range(len(trs)):
-            
-            for k, v in trs[i].iteritems():
-                tr = TR()
-                for k2 in v.keys():
-                    t = self.getTotalForFileID(k2, st)
-                    itr += 1
-                    ftype = k2.rsplit('-', 1)[1]
-                    if  ftype in total.keys():
-                      total[ftype] = total[ftype] + t
-                    else:
-                      total[ftype] = t
-                    vl[ftype]= t
-        for  j in sorted(vl):
-          if vl[j]:
-            tr.append(TD(vl[j]))
-        table.append(tr)
-        return table, total
-              
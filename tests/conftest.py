@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+pytest fixtures: OMP databases with synthetic presses from benchmarks/fixtures.py. The fixtures
+require web2py's gluon package, test modules using them skip themselves without it.
+"""
+import sys
+from os.path import abspath, dirname, join
+
+import pytest
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+
+
+def createPress(size):
+    from fixtures import create_db, populate_press
+    return populate_press(create_db(), **size)
+
+
+@pytest.fixture(scope='module')
+def small_press():
+    from fixtures import SMALL_PRESS
+    db = createPress(SMALL_PRESS)
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope='module')
+def large_press():
+    from fixtures import LARGE_PRESS
+    db = createPress(LARGE_PRESS)
+    yield db
+    db.close()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Cache entries of CachedOMPDAL: conversion of getter results and invalidation by generation tokens.
+"""
+import pickle
+
+import pytest
+
+pytest.importorskip('gluon')
+
+from fixtures import CONF, PRESS_ID, create_db, populate_press
+
+from ompcache import CachedOMPDAL, EventLogInvalidator, MemoryCache, _freeze, _thaw
+from ompdal import ASSOC_TYPE_MONOGRAPH, OMPDAL, RawRows, ReadOnlyOMPItem
+
+
+@pytest.fixture
+def db():
+    db = populate_press(create_db(), submissions=2, chapters=2, formats=2)
+    yield db
+    db.close()
+
+
+def roundTrip(value, db):
+    # Entries of FileCache and MemcachedCache are pickled
+    return _thaw(pickle.loads(pickle.dumps(_freeze(value))), db)
+
+
+def test_rows_round_trip(db):
+    rows = OMPDAL(db, CONF).getPublishedSubmissionsRangeByPressSorted(PRESS_ID, 0, 10)
+    thawed = roundTrip(rows, db)
+    assert thawed.colnames == rows.colnames
+    assert thawed.as_list() == rows.as_list()
+    assert str(thawed) == str(rows)
+    ps = db.published_submissions
+    assert [r[ps.date_published] for r in thawed] == [r[ps.date_published] for r in rows]
+
+
+def test_raw_rows_round_trip(db):
+    rows = OMPDAL(db, CONF, raw_rows=True).getChaptersBySubmission(1)
+    thawed = roundTrip(rows, db)
+    assert isinstance(thawed, RawRows)
+    assert thawed == rows
+    assert [r.chapter_id for r in thawed] == [r.chapter_id for r in rows]
+
+
+def test_item_round_trip(db):
+    item = OMPDAL(db, CONF).getPublishedSubmissionWithAssociatedItems(1)
+    for value in [item, item.readOnly()]:
+        thawed = roundTrip(value, db)
+        assert isinstance(thawed, ReadOnlyOMPItem) == isinstance(value, ReadOnlyOMPItem)
+        assert thawed.attributes.as_dict() == value.attributes.as_dict()
+        assert thawed.settings.getValues('title') == value.settings.getValues('title')
+        assert sorted(thawed.associated_items) == sorted(value.associated_items)
+        assert ([a.attributes.author_id for a in thawed.associated_items['authors']]
+                == [a.attributes.author_id for a in value.associated_items['authors']])
+
+
+def test_thawed_entries_are_independent(db):
+    ompdal = CachedOMPDAL(OMPDAL(db, CONF), default_ttl=3600)
+    settings = ompdal.getPublishedSubmissionWithAssociatedItems(1).settings
+    settings._settings['title'] = {'': 'Changed'}
+    assert ompdal.getPublishedSubmissionWithAssociatedItems(1).settings.getLocalizedValue('title', '') != 'Changed'
+
+
+def setPosition(db, submission_id, position):
+    db(db.submissions.submission_id == submission_id).update(series_position=position)
+    db.commit()
+
+
+def setStatus(db, submission_id, status):
+    db(db.submissions.submission_id == submission_id).update(status=status)
+    db.commit()
+
+
+def test_invalidate_submission(db):
+    ompdal = CachedOMPDAL(OMPDAL(db, CONF), default_ttl=3600)
+    assert ompdal.getSubmission(1).series_position == '1'
+    assert ompdal.getSubmission(2).series_position == '2'
+    setPosition(db, 1, 'new')
+    setPosition(db, 2, 'new')
+    assert ompdal.getSubmission(1).series_position == '1'
+    ompdal.invalidateSubmission(1)
+    assert ompdal.getSubmission(1).series_position == 'new'
+    assert ompdal.getSubmission(2).series_position == '2'
+
+
+def test_invalidate_catalog(db):
+    ompdal = CachedOMPDAL(OMPDAL(db, CONF), default_ttl=3600)
+    assert len(ompdal.getSubmissionsByPress(PRESS_ID)) == 2
+    setStatus(db, 2, 1)
+    ompdal.invalidateSubmission(2, catalog=False)
+    assert len(ompdal.getSubmissionsByPress(PRESS_ID)) == 2
+    ompdal.invalidateSubmission(2)
+    assert len(ompdal.getSubmissionsByPress(PRESS_ID)) == 1
+
+
+def test_invalidate_all(db):
+    ompdal = CachedOMPDAL(OMPDAL(db, CONF), default_ttl=3600)
+    assert ompdal.getPressSettings(PRESS_ID).first().setting_value == 'Heidelberg'
+    db(db.press_settings.press_id == PRESS_ID).update(setting_value='Mannheim')
+    db.commit()
+    ompdal.invalidateSubmission(1)
+    assert ompdal.getPressSettings(PRESS_ID).first().setting_value == 'Heidelberg'
+    ompdal.invalidateAll()
+    assert ompdal.getPressSettings(PRESS_ID).first().setting_value == 'Mannheim'
+
+
+def logEvent(db, log_id, submission_id, message):
+    db.event_log.insert(log_id=log_id, assoc_type=ASSOC_TYPE_MONOGRAPH, assoc_id=submission_id,
+                        message=message)
+    db.commit()
+
+
+def test_event_log_invalidator(db):
+    cache = MemoryCache()
+    ompdal = CachedOMPDAL(OMPDAL(db, CONF), cache=cache, default_ttl=3600)
+    invalidator = EventLogInvalidator(ompdal)
+    # Without a stored watermark, the first poll discards all entries
+    generation = ompdal.getGeneration('epoch')
+    assert invalidator.poll() == []
+    assert ompdal.getGeneration('epoch') != generation
+
+    assert ompdal.getSubmission(1).series_position == '1'
+    assert len(ompdal.getSubmissionsByPress(PRESS_ID)) == 2
+    setPosition(db, 1, 'new')
+    setStatus(db, 2, 1)
+    logEvent(db, 100, 1, 'submission.event.fileUploaded')
+    assert invalidator.poll() == [1]
+    assert ompdal.getSubmission(1).series_position == 'new'
+    assert len(ompdal.getSubmissionsByPress(PRESS_ID)) == 2
+    logEvent(db, 101, 2, 'submission.event.metadataUnpublished')
+    assert invalidator.poll() == [2]
+    assert len(ompdal.getSubmissionsByPress(PRESS_ID)) == 1
+    assert invalidator.poll() == []
+
+    # Another worker continues from the stored watermark without discarding all entries
+    generation = ompdal.getGeneration('epoch')
+    logEvent(db, 102, 1, 'submission.event.fileUploaded')
+    assert EventLogInvalidator(CachedOMPDAL(OMPDAL(db, CONF), cache=cache, default_ttl=3600)).poll() == [1]
+    assert ompdal.getGeneration('epoch') == generation
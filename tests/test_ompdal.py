@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Keyset pagination of OMPDAL on a press with NULL and duplicate sort keys.
+"""
+import datetime
+
+import pytest
+
+pytest.importorskip('gluon')
+
+from fixtures import CONF, PRESS_ID, create_db, populate_press
+
+from ompdal import OMPDAL, encodeCursor
+
+SUBMISSIONS = 12
+DATE = datetime.datetime(2020, 1, 1)
+# Sort keys of the submissions by id: NULLs and duplicates at the start, in the middle and at the end
+DATES = {1: None, 2: DATE, 3: None, 4: DATE, 5: DATE, 6: DATE + datetime.timedelta(days=1), 7: None,
+         8: DATE + datetime.timedelta(days=2), 9: DATE + datetime.timedelta(days=2), 10: DATE, 11: None,
+         12: DATE - datetime.timedelta(days=1)}
+
+
+@pytest.fixture(scope='module')
+def ompdal():
+    db = populate_press(create_db(), submissions=SUBMISSIONS, chapters=0, formats=1)
+    for submission_id, date in DATES.items():
+        db(db.submissions.submission_id == submission_id).update(date_submitted=date)
+        db(db.published_submissions.submission_id == submission_id).update(date_published=date)
+    db.commit()
+    yield OMPDAL(db, CONF)
+    db.close()
+
+
+def expectedOrder(descending):
+    """
+    Get the submission ids in the order of _selectPage: NULL first in ascending, last in descending order.
+    """
+    return sorted(DATES, key=lambda i: (DATES[i] is not None, DATES[i] or DATE, i), reverse=descending)
+
+
+def allPages(get_page, limit):
+    ids, pages = [], 0
+    rows, cursor = get_page(limit, None)
+    while True:
+        ids.extend(r.submissions.submission_id if 'submissions' in r else r.submission_id for r in rows)
+        pages += 1
+        if not cursor:
+            return ids, pages
+        rows, cursor = get_page(limit, cursor)
+
+
+@pytest.mark.parametrize('limit', [1, 2, 5, SUBMISSIONS, SUBMISSIONS + 1])
+def test_submissions_pages(ompdal, limit):
+    ids, pages = allPages(lambda l, c: ompdal.getSubmissionsPageByPress(PRESS_ID, l, cursor=c), limit)
+    assert ids == expectedOrder(True)
+    assert pages == max(1, -(-SUBMISSIONS // limit))
+    # Same submissions as the range getter, which does not define the order of equal dates
+    assert set(ids) == set(r.submission_id for r in ompdal.getSubmissionsRangeByPress(PRESS_ID, 0, SUBMISSIONS))
+
+
+@pytest.mark.parametrize('ascending', [True, False])
+@pytest.mark.parametrize('limit', [1, 3, SUBMISSIONS])
+def test_published_submissions_pages(ompdal, ascending, limit):
+    ids, _ = allPages(lambda l, c: ompdal.getPublishedSubmissionsPageByPressSorted(
+        PRESS_ID, l, cursor=c, order_by_ascending=ascending), limit)
+    assert ids == expectedOrder(not ascending)
+    rows = ompdal.getPublishedSubmissionsRangeByPressSorted(PRESS_ID, 0, SUBMISSIONS, order_by_ascending=ascending)
+    assert set(ids) == set(r.submissions.submission_id for r in rows)
+
+
+def test_ignored_submission(ompdal):
+    ids, _ = allPages(lambda l, c: ompdal.getSubmissionsPageByPress(PRESS_ID, l, cursor=c,
+                                                                     ignored_submission_id=4), 5)
+    assert ids == [i for i in expectedOrder(True) if i != 4]
+
+
+@pytest.mark.parametrize('cursor', ['', None])
+def test_first_page(ompdal, cursor):
+    rows, _ = ompdal.getSubmissionsPageByPress(PRESS_ID, 3, cursor=cursor)
+    assert [r.submission_id for r in rows] == expectedOrder(True)[:3]
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor', encodeCursor([DATE]), encodeCursor([DATE, 1, 2]),
+                                    encodeCursor([DATE, None])])
+def test_invalid_cursor(ompdal, cursor):
+    with pytest.raises(ValueError):
+        ompdal.getSubmissionsPageByPress(PRESS_ID, 3, cursor=cursor)
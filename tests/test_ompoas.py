@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+OASClient against a local statistics server: reuse of connections, retries and timeouts, and
+CachedOASClient in front of it.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import abspath, dirname
+
+import pytest
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from ompoas import CachedOASClient, OASClient, OASError
+
+STATISTICS = {'1-2-pdf': {'all_years': [{'zeitraum': '2020', 'volltext': '3'}]}}
+
+
+class StatisticsHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with STATISTICS after the delay of the server, or with HTTP 503 as long as
+    the server has failures left.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.failures > 0
+            self.server.failures -= fail
+        time.sleep(self.server.delay)
+        body = b'' if fail else json.dumps(STATISTICS).encode('utf-8')
+        self.send_response(503 if fail else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StatisticsHandler)
+    server.lock = threading.Lock()
+    server.connections = server.requests = server.failures = 0
+    server.delay = 0
+    server.url = 'http://127.0.0.1:{}/oas'.format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = OASClient(server.url, 'omp', read_timeout=1, retry_backoff=0)
+    yield client
+    client.close()
+
+
+def test_statistics(server, client):
+    assert client.getStatistics(['1-2-pdf']) == STATISTICS
+    assert client.getStatistics([]) == {}
+    assert server.requests == 1
+
+
+def test_connection_reuse(server, client):
+    for _ in range(5):
+        client.getStatistics(['1-2-pdf'])
+    assert server.requests == 5
+    assert server.connections == 1
+
+
+def test_retry_on_server_error(server, client):
+    server.failures = 2
+    assert client.getStatistics(['1-2-pdf']) == STATISTICS
+    assert server.requests == 3
+
+
+def test_server_error(server, client):
+    server.failures = 3
+    with pytest.raises(OASError):
+        client.getStatistics(['1-2-pdf'])
+    assert server.requests == 3
+
+
+def test_no_retry_on_timeout(server):
+    server.delay = 0.5
+    client = OASClient(server.url, 'omp', read_timeout=0.1, retry_backoff=0)
+    with pytest.raises(OASError):
+        client.getStatistics(['1-2-pdf'])
+    client.close()
+    assert server.requests == 1
+
+
+def test_concurrent_statistics(server, client):
+    assert client.getStatisticsConcurrently(['1-2-pdf'], [], ['1-2-pdf']) == [STATISTICS, {}, STATISTICS]
+    assert client.getStatisticsConcurrently() == []
+
+
+def test_deadline(server):
+    server.delay = 0.3
+    # One worker thread: the third list waits for the second one and misses the deadline
+    client = OASClient(server.url, 'omp', read_timeout=1, pool_size=1, deadline=0.45)
+    start = time.monotonic()
+    with pytest.raises(OASError):
+        client.getStatisticsConcurrently(['1-2-pdf'], ['1-2-pdf'], ['1-2-pdf'])
+    assert time.monotonic() - start < 0.55
+    client.close()
+
+
+@pytest.fixture
+def cache():
+    pytest.importorskip('pydal')
+    from ompcache import MemoryCache
+    return MemoryCache()
+
+
+def test_cached_statistics(server, client, cache):
+    cached = CachedOASClient(client, cache)
+    assert cached.getStatisticsConcurrently(['1-2-pdf'], [], ['1-2-pdf', '1-3-pdf']) == [STATISTICS, {}, STATISTICS]
+    assert server.requests == 2
+    assert cached.getStatisticsConcurrently(['1-2-pdf'], ['1-3-pdf', '1-2-pdf']) == [STATISTICS, STATISTICS]
+    assert cached.getStatistics(['1-2-pdf']) == STATISTICS
+    assert server.requests == 2
+    cached.close()
+
+
+def test_refresh_does_not_delay_requests(server, client, cache):
+    cached = CachedOASClient(client, cache, ttl=0, max_workers=1)
+    cached.getStatisticsConcurrently(['1-2-pdf'], ['1-3-pdf'])
+    server.delay = 0.3
+    # Both entries are stale: their refreshes occupy the refresh thread, the uncached list is requested at once
+    start = time.monotonic()
+    assert cached.getStatisticsConcurrently(['1-2-pdf'], ['1-3-pdf'], ['1-4-pdf']) == [STATISTICS] * 3
+    assert time.monotonic() - start < 0.45
+    cached.close()
+    assert server.requests == 5
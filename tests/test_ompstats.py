@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Aggregation of download statistics by OMPStats for a submission of the fixture press with one full
+book file (id 1) and two chapter files (ids 2 and 3) in the format PDF.
+"""
+import pytest
+
+pytest.importorskip('gluon')
+
+from fixtures import CONF, Conf, create_db, populate_press
+
+from ompcache import MemoryCache
+from ompoas import PrefetchedOASClient
+from ompstats import OMPStats, parsePeriod
+
+FULL, CHAPTER_1, CHAPTER_2 = '1-1-PDF', '1-2-PDF', '1-3-PDF'
+STATISTICS = {
+    FULL: {'all_years': [{'zeitraum': '19', 'volltext': '3'}, {'zeitraum': '2020', 'volltext': '4'}],
+           '2020': [{'zeitraum': '2020-01', 'volltext': '1'}, {'zeitraum': '2020-02', 'volltext': '3'}]},
+    CHAPTER_1: {'all_years': [{'zeitraum': '2020', 'volltext': '5'}]},
+    CHAPTER_2: {'all_years': [{'zeitraum': '2019', 'volltext': '1'}, {'zeitraum': 'unknown', 'volltext': '2'}]},
+}
+
+
+class StatisticsClient:
+    """
+    Client answering with the statistics of the requested file ids in STATISTICS.
+    """
+    repo_id = 'omp'
+
+    def getStatistics(self, file_ids):
+        return dict((fid, STATISTICS[fid]) for fid in file_ids if fid in STATISTICS)
+
+    def getStatisticsConcurrently(self, *file_id_lists):
+        return [self.getStatistics(file_ids) for file_ids in file_id_lists]
+
+    def isAvailable(self):
+        return True
+
+
+CONF_STATS = Conf(CONF, **{'statistik.server': 'http://localhost', 'statistik.id': 'omp'})
+
+
+@pytest.fixture(scope='module')
+def stats():
+    db = populate_press(create_db(), submissions=1, chapters=2, formats=2)
+    yield OMPStats(CONF_STATS, db, 'de_DE', client=StatisticsClient())
+    db.close()
+
+
+def test_statistics(stats):
+    statistics = stats.getStatistics(1, ['PDF'])
+    assert statistics['full'] == {
+        'formats': ['PDF'],
+        'items': [{'name': 'PDF', 'downloads': {'PDF': 7}, 'years': {'2019': {'PDF': 3}, '2020': {'PDF': 4}}}],
+        'downloads': {'PDF': 7},
+        'years': {'2019': {'PDF': 3}, '2020': {'PDF': 4}},
+    }
+    chapters = statistics['chapters']
+    assert [item['name'] for item in chapters['items']] == ['Chapter de_DE 1', 'Chapter de_DE 2']
+    # Downloads of unknown periods are not counted
+    assert [item['downloads'] for item in chapters['items']] == [{'PDF': 5}, {'PDF': 1}]
+    assert chapters['downloads'] == {'PDF': 6}
+    assert chapters['years'] == {'2019': {'PDF': 1}, '2020': {'PDF': 5}}
+
+
+def test_statistics_without_downloads(stats):
+    statistics = stats.aggregateStatistics([{'Chapter': {'1-9-PDF': ''}}], {}, ['PDF', 'xml'])
+    assert statistics == {'formats': ['PDF', 'xml'], 'items': [{'name': 'Chapter', 'downloads': {'PDF': 0},
+                                                                'years': {}}],
+                          'downloads': {'PDF': 0, 'xml': 0}, 'years': {}}
+
+
+def test_time_series(stats):
+    series = stats.getTimeSeries(1, ['PDF'])
+    assert series['full']['files'][FULL] == {'years': [['2019', 3], ['2020', 4]],
+                                             'months': [['2020-01', 1], ['2020-02', 3]]}
+    assert series['chapters']['items'] == [
+        {'name': 'Chapter de_DE 1', 'years': [['2020', 5]], 'months': []},
+        {'name': 'Chapter de_DE 2', 'years': [['2019', 1]], 'months': []},
+    ]
+    assert series['submission']['total'] == {'years': [['2019', 4], ['2020', 9]],
+                                             'months': [['2020-01', 1], ['2020-02', 3]]}
+    assert series['submission']['formats'] == {'PDF': series['submission']['total']}
+
+
+def test_time_series_matches_statistics(stats):
+    statistics = stats.getStatistics(1, ['PDF'])
+    series = stats.getTimeSeries(1, ['PDF'])
+    for part in ['chapters', 'full']:
+        assert dict(series[part]['total']['years']) == dict(
+            (year, n['PDF']) for year, n in statistics[part]['years'].items())
+
+
+def test_press_file_ids():
+    # Files 1 to 3 of submission 1, 4 to 6 of the unpublished submission 2 and 7 to 9 of submission 3
+    db = populate_press(create_db(), submissions=3, chapters=2, formats=2)
+    db(db.submissions.submission_id == 2).update(status=1)
+    client = PrefetchedOASClient(StatisticsClient(), MemoryCache())
+    stats = OMPStats(CONF_STATS, db, 'de_DE', client=client)
+    assert stats.getPressFileIds(['PDF', 'Print']) == ['1-1-PDF', '1-2-PDF', '1-3-PDF', '3-7-PDF', '3-8-PDF',
+                                                         '3-9-PDF']
+    assert stats.prefetchPressStatistics(['PDF']) == 6
+    assert client._getStored([FULL, '3-7-PDF']) == ({FULL: STATISTICS[FULL]}, [])
+    db.close()
+
+
+def test_prefetch_requires_prefetched_client(stats):
+    with pytest.raises(TypeError):
+        stats.prefetchPressStatistics(['PDF'])
+
+
+def test_totals(stats):
+    trs, fids = stats.createChapterDict(1, ['PDF'])
+    _, totals = stats.setTotalsToTable([], stats.getOASResponse(fids), trs, {'PDF': None})
+    assert totals == {'PDF': 6}
+    trs, fids = stats.createFullDict(1, ['PDF'])
+    _, totals = stats.setTotalsToFullTable([], stats.getOASResponse(fids), trs, {'PDF': None})
+    assert totals == {'PDF': 7}
+
+
+def test_monthly_statistics(stats):
+    # Files without yearly entries are counted with the sum of their months
+    st = {CHAPTER_1: {'2020': [{'zeitraum': '2020-01', 'volltext': '2'}, {'zeitraum': '202002', 'volltext': '3'}],
+                      '2021': [{'zeitraum': '1/2021', 'volltext': '4'}]}}
+    trs = [{'Chapter': {CHAPTER_1: ''}}]
+    statistics = stats.aggregateStatistics(trs, st, ['PDF'])
+    assert statistics['downloads'] == {'PDF': 9}
+    assert statistics['years'] == {'2020': {'PDF': 5}, '2021': {'PDF': 4}}
+    series = stats.aggregateTimeSeries(trs, st)
+    assert series['total'] == {'years': [['2020', 5], ['2021', 4]],
+                               'months': [['2020-01', 2], ['2020-02', 3], ['2021-01', 4]]}
+
+
+@pytest.mark.parametrize('period, expected', [
+    ('2016', ('2016', None)), ('16', ('2016', None)), (' 2016 ', ('2016', None)), (2016, ('2016', None)),
+    ('2016-03', ('2016', '2016-03')), ('201603', ('2016', '2016-03')), ('3/2016', ('2016', '2016-03')),
+    ('03.2016', ('2016', '2016-03')), ('12.1999', ('1999', '1999-12')),
+    ('2016-13', (None, None)), ('2016-00', (None, None)), ('13/2016', (None, None)), ('1603', (None, None)),
+    ('216', (None, None)), ('2016-3', (None, None)), ('', (None, None)), ('unknown', (None, None)),
+])
+def test_parse_period(period, expected):
+    assert parsePeriod(period) == expected
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Number of queries and time of the main OMPDAL getters on a small and on a large synthetic press.
+
+A budget is either a number of queries, which must not grow with the size of the press (growth
+indicates an N+1 pattern), or a function of the press size for getters whose queries are expected to
+grow, e.g. one query per page.
+"""
+import time
+
+import pytest
+
+pytest.importorskip('gluon')
+
+from fixtures import CONF, LARGE_PRESS, PRESS_ID, SMALL_PRESS
+
+from ompdal import OMPDAL
+
+PAGE_SIZE = 5
+
+
+def lastPage(ompdal):
+    rows, cursor = ompdal.getSubmissionsPageByPress(PRESS_ID, PAGE_SIZE)
+    while cursor:
+        rows, cursor = ompdal.getSubmissionsPageByPress(PRESS_ID, PAGE_SIZE, cursor=cursor)
+    return rows
+
+
+# Name, function of an OMPDAL and the press size, maximum queries, maximum seconds on the large press
+CHECKS = [
+    ('getPublishedSubmissionWithAssociatedItems',
+     lambda ompdal, press: ompdal.getPublishedSubmissionWithAssociatedItems(1), 19, 0.5),
+    ('getPublishedSubmissionsWithAssociatedItemsByPress',
+     lambda ompdal, press: ompdal.getPublishedSubmissionsWithAssociatedItemsByPress(PRESS_ID), 10, 2.0),
+    ('getLatestFileRevisionsBySubmission',
+     lambda ompdal, press: ompdal.getLatestFileRevisionsBySubmission(1), 1, 0.2),
+    ('getLatestFileRevisionsByPress',
+     lambda ompdal, press: ompdal.getLatestFileRevisionsByPress(PRESS_ID), 1, 1.0),
+    # Chapters, publication format and chapter file index once, then the files of every chapter
+    ('getLatestRevisionOfChapterFileByPublicationFormat (all chapters)',
+     lambda ompdal, press: [ompdal.getLatestRevisionOfChapterFileByPublicationFormat(c.chapter_id, 1)
+                            for c in ompdal.getChaptersBySubmission(1)],
+     lambda press: 3 + press['chapters'], 0.5),
+    ('getChapterSettingsByIds',
+     lambda ompdal, press: ompdal.getChapterSettingsByIds([c.chapter_id for c in ompdal.getChaptersBySubmission(1)]),
+     2, 0.2),
+    ('getPublicationFormatByName (repeated)',
+     lambda ompdal, press: [ompdal.getPublicationFormatByName(1, name) for name in ['PDF', 'Print'] * 5], 2, 0.2),
+    ('getSubmissionsBySeries (one page)',
+     lambda ompdal, press: ompdal.getSubmissionsBySeries(1, limitby=(0, 10)), 3, 0.5),
+    # One query per page
+    ('getSubmissionsPageByPress (last page)',
+     lambda ompdal, press: lastPage(ompdal),
+     lambda press: -(-press['submissions'] // PAGE_SIZE), 1.0),
+    ('iterSubmissionsByPress',
+     lambda ompdal, press: list(ompdal.iterSubmissionsByPress(PRESS_ID, chunk_size=press['submissions'] + 1)), 1, 0.5),
+]
+
+
+def run(db, check, press):
+    """
+    Run a check with a new OMPDAL, so that no check profits from indexes built by another one, and
+    return its number of queries and time.
+    """
+    ompdal = OMPDAL(db, CONF)
+    with ompdal.profile(slow_query_threshold=float('inf')) as profile:
+        start = time.perf_counter()
+        check(ompdal, press)
+        seconds = time.perf_counter() - start
+    return profile.getSummary()['queries'], seconds
+
+
+@pytest.mark.parametrize('check, max_queries, max_seconds', [c[1:] for c in CHECKS], ids=[c[0] for c in CHECKS])
+def test_query_budget(small_press, large_press, check, max_queries, max_seconds):
+    small_queries, _ = run(small_press, check, SMALL_PRESS)
+    queries, seconds = run(large_press, check, LARGE_PRESS)
+    if callable(max_queries):
+        assert small_queries <= max_queries(SMALL_PRESS)
+        assert queries <= max_queries(LARGE_PRESS)
+    else:
+        assert queries <= max_queries
+        assert queries <= small_queries, 'queries grow with press size'
+    assert seconds <= max_seconds